@@ -0,0 +1,143 @@
+# coding: utf-8
+# Gerador de relatórios em lote (sem Streamlit): renderiza os gráficos de
+# exportação, importação total vs. China e origem (treemap) para todos os NCMs
+# e grupos, distribuindo o trabalho em um pool de processos.
+#
+# Uso:
+#     python comex_batch.py --saida boletim --formatos html json png --processos 8
+#
+# PNG requer o pacote opcional "kaleido".
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from comex_data import (
+    FILE_PATH, SHEET_NAME, COL_NCM_CODIGO, COL_NCM_DESCRICAO, GROUPS_FILE,
+    load_cleaned_data, build_aggregate_cube, load_ncm_groups, build_group_cube, build_origin_table,
+)
+from comex_charts import (
+    prepare_plot_data, prepare_origin_data, periodo_label,
+    build_export_figure, build_import_figure, build_treemap_figure,
+)
+from comex_store import STORE_DIR, store_version, load_store_data, load_store_cube
+
+FORMATOS = ["html", "json", "png"]
+FIGURE_NAMES = {
+    "exportacao": build_export_figure,
+    "importacao_china": build_import_figure,
+}
+
+# Dados compartilhados por cada processo do pool (definidos em _init_worker).
+_worker_state = {}
+
+def load_dataset(source=FILE_PATH, sheet_name=SHEET_NAME, store_dir=STORE_DIR):
+    """Tabela longa e cubo: do armazenamento incremental, se populado, ou da planilha."""
+    if store_version(store_dir):
+        return load_store_data(store_dir), load_store_cube(store_dir)
+    df_long = load_cleaned_data(source, sheet_name)
+    return df_long, build_aggregate_cube(df_long)
+
+def list_selections(df_long, ncm_groups: dict, group_descriptions: dict) -> list:
+    """(chave, descrição, NCMs, é grupo?) para cada grupo e cada NCM individual."""
+    selections = [
+        (group_name, group_descriptions.get(group_name, f"Agregado do grupo {group_name}"), ncms, True)
+        for group_name, ncms in ncm_groups.items()
+    ]
+    ncm_options = df_long[[COL_NCM_CODIGO, COL_NCM_DESCRICAO]].drop_duplicates().sort_values(by=COL_NCM_CODIGO)
+    for ncm_cod, ncm_desc in zip(ncm_options[COL_NCM_CODIGO].astype(str), ncm_options[COL_NCM_DESCRICAO].astype(str)):
+        selections.append((ncm_cod, ncm_desc, [ncm_cod], False))
+    return selections
+
+def _safe_name(key: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", key)
+
+def _init_worker(origin_table, periodo, cube, group_cube, output_dir, formatos, include_plotlyjs):
+    _worker_state.update(
+        origin_table=origin_table, cube=cube, group_cube=group_cube, output_dir=output_dir, formatos=formatos,
+        include_plotlyjs=include_plotlyjs, periodo=periodo,
+    )
+
+def _write_figure(fig, base_path: str) -> list:
+    written = []
+    for formato in _worker_state["formatos"]:
+        path = f"{base_path}.{formato}"
+        if formato == "html":
+            fig.write_html(path, include_plotlyjs=_worker_state["include_plotlyjs"])
+        elif formato == "json":
+            fig.write_json(path)
+        elif formato == "png":
+            fig.write_image(path)
+        written.append(os.path.basename(path))
+    return written
+
+def render_selection(selection) -> dict:
+    """Renderiza e grava as figuras de uma seleção; executado nos processos do pool."""
+    key, description, ncms, is_group = selection
+    base_name = os.path.join(_worker_state["output_dir"], _safe_name(key))
+    # Grupos vêm do cubo de grupos (todos calculados de uma vez); NCMs, do cubo.
+    cube = _worker_state["group_cube"] if is_group else _worker_state["cube"]
+    ncm_plot_data = prepare_plot_data(cube, [key])
+    figures = {name: build(ncm_plot_data, key) for name, build in FIGURE_NAMES.items()}
+    origin_data = prepare_origin_data(_worker_state["origin_table"], ncms)
+    figures["origem_treemap"] = build_treemap_figure(origin_data, key, _worker_state["periodo"])
+    arquivos = []
+    for name, fig in figures.items():
+        if fig is not None:
+            arquivos.extend(_write_figure(fig, f"{base_name}_{name}"))
+    return {"chave": key, "descricao": description, "grupo": is_group, "ncms": list(ncms), "arquivos": arquivos}
+
+def run_batch(output_dir: str, formatos: list, processos=None, include_plotlyjs="cdn",
+              source=FILE_PATH, sheet_name=SHEET_NAME, store_dir=STORE_DIR, groups=None) -> list:
+    """Renderiza todas as seleções em paralelo e grava um índice (index.json) no diretório de saída.
+
+    groups é o par (grupos -> NCMs, grupos -> descrição) de load_ncm_groups;
+    por padrão, lido de GROUPS_FILE a cada execução.
+    """
+    if "png" in formatos:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            raise SystemExit("Exportação PNG requer o pacote 'kaleido' (pip install kaleido).")
+    ncm_groups, group_descriptions = groups if groups is not None else load_ncm_groups(GROUPS_FILE)
+    os.makedirs(output_dir, exist_ok=True)
+    df_long, cube = load_dataset(source, sheet_name, store_dir)
+    selections = list_selections(df_long, ncm_groups, group_descriptions)
+    group_cube = build_group_cube(cube, ncm_groups)
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        initializer=_init_worker,
+        initargs=(build_origin_table(df_long), periodo_label(df_long), cube, group_cube, output_dir, formatos, include_plotlyjs),
+    ) as executor:
+        chunksize = max(1, len(selections) // (4 * (processos or os.cpu_count() or 1)))
+        results = list(executor.map(render_selection, selections, chunksize=chunksize))
+    with open(os.path.join(output_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera os gráficos do dashboard para todos os NCMs e grupos, sem Streamlit.")
+    parser.add_argument("--saida", default="relatorios", help="Diretório de saída (padrão: relatorios)")
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=["html", "json"], help="Formatos a gravar (padrão: html json)")
+    parser.add_argument("--processos", type=int, default=None, help="Número de processos (padrão: número de CPUs)")
+    parser.add_argument("--plotlyjs", choices=["cdn", "directory", "inline"], default="cdn",
+                        help="Como incluir o plotly.js nos HTML (padrão: cdn)")
+    parser.add_argument("--fonte", default=FILE_PATH, help="Planilha XLSX (caminho ou URL) usada se o armazenamento estiver vazio")
+    parser.add_argument("--aba", default=SHEET_NAME, help=f"Aba com os resultados (padrão: {SHEET_NAME})")
+    parser.add_argument("--store", default=STORE_DIR, help=f"Diretório do armazenamento incremental (padrão: {STORE_DIR})")
+    parser.add_argument("--grupos", default=GROUPS_FILE, help=f"Arquivo JSON com os grupos de NCMs (padrão: {GROUPS_FILE})")
+    args = parser.parse_args()
+    include_plotlyjs = True if args.plotlyjs == "inline" else args.plotlyjs
+    try:
+        groups = load_ncm_groups(args.grupos)
+    except ValueError as e:
+        raise SystemExit(f"Configuração de grupos inválida ({args.grupos}): {e}")
+    start = time.perf_counter()
+    results = run_batch(args.saida, args.formatos, args.processos, include_plotlyjs, args.fonte, args.aba, args.store, groups)
+    total_arquivos = sum(len(result["arquivos"]) for result in results)
+    print(f"{len(results)} seleções, {total_arquivos} arquivos em '{args.saida}' ({time.perf_counter() - start:.1f} s)")
+
+if __name__ == "__main__":
+    main()
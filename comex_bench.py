@@ -0,0 +1,217 @@
+# coding: utf-8
+# Benchmarks das etapas do pipeline (leitura, limpeza, agregação, treemap e
+# construção dos gráficos) sobre dados sintéticos no formato do Comex Stat.
+#
+# Uso:
+#     python comex_bench.py --cenarios pequeno medio --saida bench_resultados.json
+#     python comex_bench.py --cenarios medio --baseline bench_baseline.json --tolerancia 0.25
+#
+# Com --baseline, o processo termina com código 1 se alguma etapa ficar mais
+# lenta ou usar mais memória que a linha de base além da tolerância.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from comex_data import (
+    COL_MES, COL_NCM_CODIGO, COL_NCM_DESCRICAO, COL_PAIS,
+    VALUE_COLUMN_FORMATS, SHEET_NAME,
+    read_raw_excel, clean_data, to_long_format, build_aggregate_cube, build_group_cube, build_origin_table,
+    country_share_gains, select_series,
+)
+from comex_screener import compute_surge_metrics
+from comex_charts import (
+    prepare_plot_data, prepare_origin_data, periodo_label,
+    build_export_figure, build_import_figure, build_treemap_figure,
+)
+
+MESES_ROTULOS = [
+    "01. Janeiro", "02. Fevereiro", "03. Março", "04. Abril", "05. Maio", "06. Junho",
+    "07. Julho", "08. Agosto", "09. Setembro", "10. Outubro", "11. Novembro", "12. Dezembro",
+]
+
+# Cenários pré-definidos: (NCMs, países, anos, linhas).
+CENARIOS = {
+    "pequeno": (20, 80, 2, 2_000),
+    "medio": (500, 150, 5, 200_000),
+    "grande": (3_000, 200, 10, 2_000_000),
+}
+# Acima deste número de linhas a etapa de leitura do XLSX é omitida (gravar a planilha já é lento demais).
+MAX_LINHAS_XLSX = 20_000
+GRUPO_BENCH_TAMANHO = 10
+# Número de grupos sobrepostos na etapa de cálculo de todos os grupos.
+GRUPOS_BENCH_QUANTIDADE = 50
+
+def generate_synthetic_extract(n_ncms: int, n_paises: int, n_anos: int, n_linhas: int, seed: int = 0) -> pd.DataFrame:
+    """Extrato sintético com as mesmas colunas da aba "Resultado" do Comex Stat.
+
+    Cada linha é uma combinação única (mês, NCM, país); os valores de kg e US$
+    por ano seguem uma distribuição log-normal, com ~60% de zeros.
+    """
+    rng = np.random.default_rng(seed)
+    n_combinacoes = 12 * n_ncms * n_paises
+    n_linhas = min(n_linhas, n_combinacoes)
+    combinacoes = rng.choice(n_combinacoes, size=n_linhas, replace=False)
+    mes_idx, resto = np.divmod(combinacoes, n_ncms * n_paises)
+    ncm_idx, pais_idx = np.divmod(resto, n_paises)
+
+    ncm_codigos = 72000000 + np.sort(rng.choice(2_000_000, size=n_ncms, replace=False))
+    paises = np.array(["China"] + [f"País {i:03d}" for i in range(1, n_paises)], dtype=object)
+    df = pd.DataFrame({
+        COL_MES: pd.Categorical.from_codes(mes_idx, categories=MESES_ROTULOS),
+        COL_NCM_CODIGO: ncm_codigos[ncm_idx],
+        COL_NCM_DESCRICAO: pd.Categorical.from_codes(ncm_idx, categories=[f"Produto siderúrgico {c}" for c in ncm_codigos]),
+        COL_PAIS: pd.Categorical.from_codes(pais_idx, categories=paises),
+    })
+    ano_final = 2025
+    for ano in range(ano_final - n_anos + 1, ano_final + 1):
+        for col_format in VALUE_COLUMN_FORMATS.values():
+            valores = rng.lognormal(mean=10, sigma=2, size=n_linhas).astype(np.int64)
+            valores[rng.random(n_linhas) < 0.6] = 0
+            df[col_format.format(ano)] = valores
+    for col in [COL_MES, COL_NCM_DESCRICAO, COL_PAIS]:
+        df[col] = df[col].astype(str)
+    return df
+
+def _measure(func, repeticoes: int):
+    tempos = []
+    result = None
+    for _ in range(repeticoes):
+        start = time.perf_counter()
+        result = func()
+        tempos.append(time.perf_counter() - start)
+    # Memória medida em uma execução separada, pois o tracemalloc distorce o tempo.
+    tracemalloc.start()
+    func()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        "tempo_s": statistics.median(tempos),
+        "tempo_min_s": min(tempos),
+        "pico_mem_mb": pico / 2**20,
+    }
+
+def run_scenario(n_ncms: int, n_paises: int, n_anos: int, n_linhas: int, repeticoes: int = 3, seed: int = 0) -> dict:
+    """Executa todas as etapas sobre um extrato sintético e devolve as medições por etapa."""
+    df_raw = generate_synthetic_extract(n_ncms, n_paises, n_anos, n_linhas, seed)
+    etapas = {}
+    if len(df_raw) <= MAX_LINHAS_XLSX:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xlsx_path = os.path.join(tmp_dir, "extrato.xlsx")
+            df_raw.to_excel(xlsx_path, sheet_name=SHEET_NAME, index=False)
+            df_raw, etapas["leitura_xlsx"] = _measure(lambda: read_raw_excel(xlsx_path, SHEET_NAME), repeticoes)
+
+    df_cleaned, etapas["limpeza"] = _measure(lambda: clean_data(df_raw), repeticoes)
+    df_long, etapas["formato_longo"] = _measure(lambda: to_long_format(df_cleaned), repeticoes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parquet_path = os.path.join(tmp_dir, "cache.parquet")
+        df_long.to_parquet(parquet_path, index=False)
+        _, etapas["leitura_cache_parquet"] = _measure(lambda: pd.read_parquet(parquet_path), repeticoes)
+    cube, etapas["cubo_agregado"] = _measure(lambda: build_aggregate_cube(df_long), repeticoes)
+
+    ncms_grupo = [str(ncm) for ncm in df_long[COL_NCM_CODIGO].cat.categories[:GRUPO_BENCH_TAMANHO]]
+    _, etapas["selecao_grupo"] = _measure(lambda: select_series(cube, ncms_grupo), repeticoes)
+    ncm_categorias = [str(ncm) for ncm in df_long[COL_NCM_CODIGO].cat.categories]
+    rng = np.random.default_rng(seed)
+    grupos = {
+        f"G{i:02d}": list(rng.choice(ncm_categorias, size=min(GRUPO_BENCH_TAMANHO, len(ncm_categorias)), replace=False))
+        for i in range(GRUPOS_BENCH_QUANTIDADE)
+    }
+    _, etapas["cubo_grupos"] = _measure(lambda: build_group_cube(cube, grupos), repeticoes)
+    _, etapas["triagem_surtos"] = _measure(lambda: compute_surge_metrics(cube), repeticoes)
+    origin_table, etapas["tabela_origem"] = _measure(lambda: build_origin_table(df_long), repeticoes)
+    _, etapas["treemap_groupby"] = _measure(lambda: prepare_origin_data(origin_table, ncms_grupo), repeticoes)
+    anos = sorted(df_long["Ano"].unique())
+    _, etapas["ganhos_participacao"] = _measure(lambda: country_share_gains(origin_table, anos[0], anos[-1]), repeticoes)
+    periodo = periodo_label(df_long)
+
+    def render(compact):
+        ncm_plot_data = prepare_plot_data(cube, ncms_grupo)
+        figures = [
+            build_export_figure(ncm_plot_data, "BENCH", compact),
+            build_import_figure(ncm_plot_data, "BENCH", compact),
+            build_treemap_figure(prepare_origin_data(origin_table, ncms_grupo), "BENCH", periodo, compact),
+        ]
+        # Inclui a serialização enviada ao navegador.
+        return sum(len(fig.to_json()) for fig in figures if fig is not None)
+
+    for etapa, compact in [("graficos_render", False), ("graficos_render_compacto", True)]:
+        payload_bytes, etapas[etapa] = _measure(lambda: render(compact), repeticoes)
+        etapas[etapa]["payload_bytes"] = payload_bytes
+    return {
+        "parametros": {"ncms": n_ncms, "paises": n_paises, "anos": n_anos, "linhas": len(df_raw)},
+        "etapas": etapas,
+    }
+
+def compare_with_baseline(resultados: dict, baseline: dict, tolerancia: float) -> list:
+    """Lista as regressões (cenário, etapa, métrica, base, atual) acima da tolerância relativa."""
+    regressoes = []
+    for cenario, dados in resultados["cenarios"].items():
+        etapas_base = baseline.get("cenarios", {}).get(cenario, {}).get("etapas", {})
+        for etapa, medidas in dados["etapas"].items():
+            medidas_base = etapas_base.get(etapa)
+            if not medidas_base:
+                continue
+            for metrica in ["tempo_s", "pico_mem_mb"]:
+                base, atual = medidas_base.get(metrica), medidas.get(metrica)
+                if base and atual is not None and atual > base * (1 + tolerancia):
+                    regressoes.append((cenario, etapa, metrica, base, atual))
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do pipeline sobre dados sintéticos no formato Comex Stat.")
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS), default=["pequeno"], help="Cenários pré-definidos")
+    parser.add_argument("--ncms", type=int, help="Cenário personalizado: número de NCMs")
+    parser.add_argument("--paises", type=int, default=150, help="Cenário personalizado: número de países")
+    parser.add_argument("--anos", type=int, default=5, help="Cenário personalizado: número de anos")
+    parser.add_argument("--linhas", type=int, default=100_000, help="Cenário personalizado: número de linhas")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições por etapa (mediana)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saida", default="bench_resultados.json", help="Arquivo JSON de resultados")
+    parser.add_argument("--baseline", help="Arquivo JSON de resultados anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita em relação à baseline (padrão: 0.2)")
+    args = parser.parse_args()
+
+    cenarios = {nome: CENARIOS[nome] for nome in args.cenarios}
+    if args.ncms:
+        cenarios["personalizado"] = (args.ncms, args.paises, args.anos, args.linhas)
+    resultados = {
+        "meta": {
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+        },
+        "cenarios": {},
+    }
+    for nome, (n_ncms, n_paises, n_anos, n_linhas) in cenarios.items():
+        resultado = run_scenario(n_ncms, n_paises, n_anos, n_linhas, args.repeticoes, args.seed)
+        resultados["cenarios"][nome] = resultado
+        print(f"== {nome} {resultado['parametros']}")
+        for etapa, medidas in resultado["etapas"].items():
+            print(f"   {etapa:<24} {medidas['tempo_s'] * 1000:>10.1f} ms {medidas['pico_mem_mb']:>10.1f} MB")
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = compare_with_baseline(resultados, baseline, args.tolerancia)
+        for cenario, etapa, metrica, base, atual in regressoes:
+            print(f"REGRESSÃO {cenario}/{etapa} {metrica}: {base:.4g} -> {atual:.4g} (+{(atual / base - 1) * 100:.0f}%)")
+        if regressoes:
+            sys.exit(1)
+        print("Sem regressões em relação à baseline.")
+
+if __name__ == "__main__":
+    main()
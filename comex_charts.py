@@ -0,0 +1,330 @@
+# coding: utf-8
+# Construção dos gráficos (Plotly) a partir do cubo agregado e da tabela longa.
+# Não depende do Streamlit: usado pelo dashboard (aco2.py) e pelo gerador de
+# relatórios em lote (comex_batch.py).
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from comex_metrics import stage
+from comex_data import (
+    COL_NCM_CODIGO, COL_PAIS, CUBE_COLUMNS, MESES_NUM_TO_NOME_ABBR,
+    select_series,
+)
+
+SMA_WINDOW = 3
+
+GRAPH_EXPORT = "Exportação (KG)"
+GRAPH_IMPORT = "Importação (KG) - Total vs China"
+GRAPH_TREEMAP = "Origem da Importação (Treemap)"
+GRAPH_OPTIONS = [GRAPH_EXPORT, GRAPH_IMPORT, GRAPH_TREEMAP]
+
+# Métricas disponíveis na comparação entre grupos (rótulo -> coluna do cubo).
+GROUP_METRICS = {
+    "Exportação (KG)": "Exportacao_kg",
+    "Importação Total (KG)": "Importacao_kg_Total",
+    "Importação China (KG)": "Importacao_kg_China",
+}
+
+# Modo de payload compacto: valores inteiros reduzidos, sem customdata com textos
+# formatados (o hovertemplate formata com os separadores pt-BR do layout), eixo Y
+# com tickformat em vez de listas de ticks e sem o template padrão do Plotly.
+# Ativado com COMEX_GRAFICOS_COMPACTOS=1.
+COMPACT_FIGURES = os.environ.get("COMEX_GRAFICOS_COMPACTOS", "").lower() in ("1", "true", "sim")
+# Separadores decimal/milhar do Plotly para números no padrão brasileiro.
+SEPARATORS_BR = ",."
+
+# --- Funções de Utilidade ---
+def format_numbers_br(values, decimal_places=2) -> np.ndarray:
+    """Formata arrays/Series inteiros no padrão brasileiro (1.234,56).
+
+    Arredonda e separa parte inteira e decimal com NumPy e insere os pontos de
+    milhar com uma única substituição por expressão regular sobre o array.
+    O arredondamento é o de np.round sobre o valor já multiplicado por
+    10 ** decimal_places (metade para o par, no float resultante), e não o
+    arredondamento decimal do f-string do Python: valores como 0.005 e 2.675
+    podem diferir dele no último dígito (0,00 e 2,68 contra 0,01 e 2,67).
+    """
+    arr = np.asarray(values, dtype=np.float64).ravel()
+    result = np.empty(arr.shape, dtype=object)
+    finite = np.isfinite(arr)
+    result[~finite] = np.where(np.isnan(arr[~finite]), "nan", np.where(arr[~finite] > 0, "inf", "-inf"))
+    if finite.any():
+        scale = 10 ** decimal_places
+        scaled = np.round(np.abs(arr[finite]) * scale)
+        int_part = pd.Series((scaled // scale).astype(np.int64)).astype(str)
+        text = int_part.str.replace(r"\B(?=(\d{3})+(?!\d))", ".", regex=True)
+        if decimal_places > 0:
+            frac_part = pd.Series((scaled % scale).astype(np.int64)).astype(str).str.zfill(decimal_places)
+            text = text + "," + frac_part
+        sign = np.where(np.signbit(arr[finite]), "-", "")
+        result[finite] = (sign + text.to_numpy(dtype=str)).astype(object)
+    return result.reshape(np.shape(values))
+
+def _compact_values(series: pd.Series) -> np.ndarray:
+    # Inteiros vão no menor tipo inteiro (serializados em base64 pelo Plotly); fracionários ficam em float64.
+    values = series.to_numpy()
+    if values.dtype.kind == "f" and not np.array_equal(values, np.round(values)):
+        return values
+    return pd.to_numeric(pd.Series(values.astype(np.int64)), downcast="integer").to_numpy()
+
+def _hover(series: pd.Series, decimal_places: int, compact: bool):
+    """(customdata, marcador do hovertemplate) para exibir a série no padrão pt-BR."""
+    if compact:
+        return None, f"%{{y:,.{decimal_places}f}}"
+    return format_numbers_br(series, decimal_places), "%{customdata}"
+
+def _apply_compact_layout(fig):
+    # Sem o template padrão do Plotly (a maior parte do JSON de uma figura pequena);
+    # o Streamlit aplica o próprio tema no navegador.
+    fig.update_layout(separators=SEPARATORS_BR, template="none")
+
+def _apply_y_axis(fig, max_y, compact: bool):
+    if compact:
+        fig.update_yaxes(tickformat=",.0f", rangemode="tozero", showgrid=True, gridwidth=1, gridcolor='LightGrey')
+    elif max_y > 0:
+        tickvals = np.linspace(0, max_y * 1.1, num=6)
+        fig.update_yaxes(tickvals=tickvals, ticktext=list(format_numbers_br(tickvals, 0)), showgrid=True, gridwidth=1, gridcolor='LightGrey')
+    else:
+        fig.update_yaxes(tickformat="d", showgrid=True, gridwidth=1, gridcolor='LightGrey')
+
+# --- Preparação dos dados ---
+def prepare_plot_data(cube: pd.DataFrame, ncms: list) -> pd.DataFrame:
+    """Série mensal da seleção com rótulo do eixo X e médias móveis (vazia se não houver dados)."""
+    ncm_plot_data = select_series(cube, ncms)
+    if ncm_plot_data.empty or ncm_plot_data["month_num"].isnull().all():
+        return pd.DataFrame()
+    ncm_plot_data = ncm_plot_data.sort_values(by=['Ano', 'month_num']).reset_index(drop=True)
+    ncm_plot_data['Mês/Ano (Eixo X)'] = ncm_plot_data['month_num'].map(MESES_NUM_TO_NOME_ABBR) + '/' + ncm_plot_data['Ano'].astype(str).str[-2:]
+    for col in CUBE_COLUMNS:
+        ncm_plot_data[f'{col}_SMA'] = ncm_plot_data[col].rolling(window=SMA_WINDOW, min_periods=1).mean()
+    return ncm_plot_data
+
+def periodo_label(df_long: pd.DataFrame, anos=None) -> str:
+    if anos:
+        return f"{anos[0]}-{anos[-1]}" if anos[0] != anos[-1] else str(anos[0])
+    anos_disponiveis = sorted(df_long["Ano"].unique()) if "Ano" in df_long.columns and not df_long.empty else []
+    return f"{anos_disponiveis[0]}-{anos_disponiveis[-1]}" if anos_disponiveis else "-"
+
+def prepare_origin_data(origin_table: pd.DataFrame, ncms: list, anos=None) -> pd.DataFrame:
+    """Importação (kg) por país de origem, somada no período, com participação (%).
+
+    Lê a tabela de origem pré-calculada (build_origin_table); anos é um
+    intervalo (inicial, final) inclusivo, ou None para todos os anos. Para um
+    único NCM em um único ano, participação e ordem já vêm prontas da tabela.
+    """
+    mask = origin_table[COL_NCM_CODIGO].isin(ncms)
+    if anos:
+        mask &= origin_table["Ano"].between(anos[0], anos[-1])
+    df_filtered_for_treemap = origin_table[mask]
+    if len(ncms) == 1 and anos and anos[0] == anos[-1]:
+        origin_data = df_filtered_for_treemap[[COL_PAIS, 'Importacao_kg', 'participacao']].rename(
+            columns={'Importacao_kg': 'Total_Import_KG', 'participacao': ' udział (%)'})
+        return origin_data.reset_index(drop=True)
+    origin_data = (
+        df_filtered_for_treemap.groupby(COL_PAIS, observed=True)['Importacao_kg'].sum()
+        .rename('Total_Import_KG').reset_index()
+    )
+    origin_data = origin_data[origin_data['Total_Import_KG'] > 0].sort_values(by='Total_Import_KG', ascending=False)
+    total_geral_import = origin_data['Total_Import_KG'].sum()
+    if total_geral_import > 0:
+        origin_data[' udział (%)'] = (origin_data['Total_Import_KG'] / total_geral_import) * 100
+    else:
+        origin_data[' udział (%)'] = 0
+    return origin_data
+
+def share_gains_by_country(gains: pd.DataFrame, n: int = 20) -> pd.DataFrame:
+    """Países que ganharam participação no maior número de NCMs (formatado em pt-BR)."""
+    if gains.empty:
+        return pd.DataFrame(columns=[COL_PAIS, "NCMs com ganho", "Ganho médio (p.p.)", "KG importado (ano final)"])
+    winners = gains[gains["variacao_pp"] > 0]
+    ranking = (
+        winners.groupby(COL_PAIS, observed=True)
+        .agg(ncms=("variacao_pp", "size"), ganho=("variacao_pp", "mean"), kg=("Importacao_kg_final", "sum"))
+        .sort_values(by=["ncms", "ganho"], ascending=False).head(n).reset_index()
+    )
+    return pd.DataFrame({
+        COL_PAIS: ranking[COL_PAIS].astype(str),
+        "NCMs com ganho": ranking["ncms"],
+        "Ganho médio (p.p.)": format_numbers_br(ranking["ganho"], 2),
+        "KG importado (ano final)": format_numbers_br(ranking["kg"], 0),
+    })
+
+def top_share_gains_table(gains: pd.DataFrame, ano_inicial: int, ano_final: int, n: int = 20) -> pd.DataFrame:
+    """Maiores ganhos de participação NCM × país entre dois anos (formatado em pt-BR)."""
+    top = gains.head(n)
+    return pd.DataFrame({
+        "NCM": top[COL_NCM_CODIGO].astype(str),
+        COL_PAIS: top[COL_PAIS].astype(str),
+        f"Participação {ano_inicial} (%)": format_numbers_br(top["participacao_inicial"], 2),
+        f"Participação {ano_final} (%)": format_numbers_br(top["participacao_final"], 2),
+        "Variação (p.p.)": format_numbers_br(top["variacao_pp"], 2),
+        f"KG importado {ano_final}": format_numbers_br(top["Importacao_kg_final"], 0),
+    })
+
+def prepare_groups_comparison(group_cube: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Série mensal de uma coluna do cubo de grupos: uma linha por mês, uma coluna por grupo."""
+    if group_cube.empty:
+        return pd.DataFrame()
+    comparison = group_cube[column].unstack(COL_NCM_CODIGO, fill_value=0).sort_index()
+    comparison.index = [f"{MESES_NUM_TO_NOME_ABBR[mes]}/{str(ano)[-2:]}" for ano, mes in comparison.index]
+    return comparison
+
+def groups_annual_table(group_cube: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Total anual de uma coluna do cubo de grupos (grupos × anos), formatado em pt-BR."""
+    annual = group_cube[column].groupby(level=[COL_NCM_CODIGO, "Ano"], observed=True).sum().unstack("Ano", fill_value=0)
+    annual = annual.sort_values(by=annual.columns[-1], ascending=False)
+    table = pd.DataFrame({str(ano): format_numbers_br(annual[ano], 0) for ano in annual.columns}, index=annual.index)
+    return table.rename_axis("Grupo").reset_index()
+
+def top_origin_table(origin_data: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+    origin_data_display = origin_data.head(n).copy()
+    origin_data_display['Total_Import_KG'] = format_numbers_br(origin_data_display['Total_Import_KG'], 0)
+    origin_data_display[' udział (%)'] = format_numbers_br(origin_data_display[' udział (%)'], 2) + " %"
+    return origin_data_display[[COL_PAIS, 'Total_Import_KG', ' udział (%)']].reset_index(drop=True)
+
+# --- Gráficos ---
+def _max_y(ncm_plot_data: pd.DataFrame, columns: list):
+    max_y = 0
+    for col_check in columns:
+        if ncm_plot_data[col_check].notna().any():
+            max_y = max(max_y, ncm_plot_data[col_check].max())
+    return max_y
+
+def build_export_figure(ncm_plot_data: pd.DataFrame, selected_key_display: str, compact: bool = COMPACT_FIGURES):
+    """Barras de exportação (kg) com média móvel; None se não houver exportação."""
+    if ncm_plot_data.empty or ncm_plot_data['Exportacao_kg'].fillna(0).eq(0).all():
+        return None
+    x = ncm_plot_data['Mês/Ano (Eixo X)']
+    y = _compact_values(ncm_plot_data['Exportacao_kg']) if compact else ncm_plot_data['Exportacao_kg']
+    with stage("rotulos_hover:exportacao", linhas=len(ncm_plot_data)):
+        hover_data_exp, hover_exp = _hover(ncm_plot_data['Exportacao_kg'], 0, compact)
+        hover_data_sma_exp, hover_sma_exp = _hover(ncm_plot_data['Exportacao_kg_SMA'], 2, compact)
+    fig_export = go.Figure()
+    fig_export.add_trace(go.Bar(x=x, y=y, name='KG Exportado', marker_color='rgb(26, 118, 255)', showlegend=False,
+                                customdata=hover_data_exp,
+                                hovertemplate=f"Mês/Ano: %{{x}}<br>KG Exportado: {hover_exp}<extra></extra>"))
+    fig_export.add_trace(go.Scatter(x=x, y=ncm_plot_data['Exportacao_kg_SMA'], mode='lines',
+                                    name=f'Média Móvel ({SMA_WINDOW} meses)',
+                                    line=dict(color='rgba(0,0,139,0.7)', width=2, dash='dot'),
+                                    customdata=hover_data_sma_exp,
+                                    hovertemplate=f"Média Móvel: {hover_sma_exp}<extra></extra>"))
+    fig_export.update_xaxes(title_text="Mês/Ano", categoryorder='array', categoryarray=x.unique(),
+                            showgrid=True, gridwidth=1, gridcolor='LightGrey', griddash='dot')
+    fig_export.update_yaxes(title_text="KG Exportado")
+    _apply_y_axis(fig_export, _max_y(ncm_plot_data, ['Exportacao_kg', 'Exportacao_kg_SMA']), compact)
+    fig_export.update_layout(title=f"<b>Exportação (KG) - {selected_key_display}</b>",
+                             hovermode="x unified", plot_bgcolor='white', legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01))
+    if compact:
+        _apply_compact_layout(fig_export)
+    return fig_export
+
+def build_import_figure(ncm_plot_data: pd.DataFrame, selected_key_display: str, compact: bool = COMPACT_FIGURES):
+    """Importação total (barras) vs. China (linhas), com médias móveis; None se não houver importação."""
+    if ncm_plot_data.empty or ncm_plot_data['Importacao_kg_Total'].fillna(0).eq(0).all():
+        return None
+    x = ncm_plot_data['Mês/Ano (Eixo X)']
+    has_china = not ncm_plot_data['Importacao_kg_China'].fillna(0).eq(0).all()
+    with stage("rotulos_hover:importacao", linhas=len(ncm_plot_data)):
+        hover_data_total, hover_total = _hover(ncm_plot_data['Importacao_kg_Total'], 0, compact)
+        hover_data_sma_total, hover_sma_total = _hover(ncm_plot_data['Importacao_kg_Total_SMA'], 2, compact)
+        if has_china:
+            hover_data_china, hover_china = _hover(ncm_plot_data['Importacao_kg_China'], 0, compact)
+            hover_data_sma_china, hover_sma_china = _hover(ncm_plot_data['Importacao_kg_China_SMA'], 2, compact)
+    fig_import = go.Figure()
+    fig_import.add_trace(go.Bar(x=x, y=_compact_values(ncm_plot_data['Importacao_kg_Total']) if compact else ncm_plot_data['Importacao_kg_Total'],
+                                name='Importação Total (KG)', marker_color='rgb(255, 165, 0)',
+                                customdata=hover_data_total,
+                                hovertemplate=f"Mês/Ano: %{{x}}<br>Importação Total: {hover_total}<extra></extra>"))
+    fig_import.add_trace(go.Scatter(x=x, y=ncm_plot_data['Importacao_kg_Total_SMA'],
+                                    name=f'Média Móvel Total ({SMA_WINDOW}m)', mode='lines',
+                                    line=dict(color='rgba(205,133,63,0.7)', width=2, dash='dot'),
+                                    customdata=hover_data_sma_total,
+                                    hovertemplate=f"Média Móvel Total: {hover_sma_total}<extra></extra>"))
+    if has_china:
+        fig_import.add_trace(go.Scatter(x=x, y=_compact_values(ncm_plot_data['Importacao_kg_China']) if compact else ncm_plot_data['Importacao_kg_China'],
+                                        name='Importação China (KG)', mode='lines+markers',
+                                        line=dict(color='rgb(220, 20, 60)', width=2), marker=dict(size=5),
+                                        customdata=hover_data_china,
+                                        hovertemplate=f"Mês/Ano: %{{x}}<br>Importação China: {hover_china}<extra></extra>"))
+        fig_import.add_trace(go.Scatter(x=x, y=ncm_plot_data['Importacao_kg_China_SMA'],
+                                        name=f'Média Móvel China ({SMA_WINDOW}m)', mode='lines',
+                                        line=dict(color='rgba(139,0,0,0.7)', width=2, dash='dash'),
+                                        customdata=hover_data_sma_china,
+                                        hovertemplate=f"Média Móvel China: {hover_sma_china}<extra></extra>"))
+    fig_import.update_layout(title=f"<b>Importação (KG) Total vs China - {selected_key_display}</b>",
+                            xaxis_title="Mês/Ano", yaxis_title="KG Importado", barmode='group',
+                            hovermode="x unified", plot_bgcolor='white',
+                            legend=dict(yanchor="top", y=0.99, xanchor="right", x=0.99))
+    fig_import.update_xaxes(categoryorder='array', categoryarray=x.unique(),
+                            showgrid=True, gridwidth=1, gridcolor='LightGrey', griddash='dot')
+    max_y_imp = _max_y(ncm_plot_data, ['Importacao_kg_Total', 'Importacao_kg_Total_SMA', 'Importacao_kg_China', 'Importacao_kg_China_SMA'])
+    _apply_y_axis(fig_import, max_y_imp, compact)
+    if compact:
+        _apply_compact_layout(fig_import)
+    return fig_import
+
+def build_treemap_figure(origin_data: pd.DataFrame, selected_key_display: str, periodo: str, compact: bool = COMPACT_FIGURES):
+    """Treemap da origem das importações; None se não houver importação registrada."""
+    if origin_data.empty:
+        return None
+    title = f"<b>Origem das Importações (KG) - {selected_key_display} (Total {periodo})</b>"
+    if compact:
+        # Participação = percentRoot; textos formatados no navegador com os separadores pt-BR.
+        fig_treemap = px.treemap(origin_data,
+                                 path=[px.Constant(f"Importações {selected_key_display}"), COL_PAIS],
+                                 values=_compact_values(origin_data['Total_Import_KG']),
+                                 color=_compact_values(origin_data['Total_Import_KG']),
+                                 color_continuous_scale='Blues',
+                                 title=title)
+        fig_treemap.update_traces(
+            textinfo='label+percent root',
+            hovertemplate="<b>País:</b> %{label}<br><b>KG Importado:</b> %{value:,.0f}<br><b>Participação:</b> %{percentRoot:.2%}<extra></extra>"
+        )
+        fig_treemap.update_layout(coloraxis_colorbar_title_text="KG")
+        _apply_compact_layout(fig_treemap)
+    else:
+        origin_data = origin_data.copy()
+        with stage("rotulos_hover:treemap", linhas=len(origin_data)):
+            origin_data['hover_text_kg'] = format_numbers_br(origin_data['Total_Import_KG'], 0)
+            origin_data['hover_text_perc'] = format_numbers_br(origin_data[' udział (%)'], 2) + "%"
+        fig_treemap = px.treemap(origin_data,
+                                 path=[px.Constant(f"Importações {selected_key_display}"), COL_PAIS],
+                                 values='Total_Import_KG',
+                                 color='Total_Import_KG',
+                                 color_continuous_scale='Blues',
+                                 title=title,
+                                 custom_data=['hover_text_kg', 'hover_text_perc', COL_PAIS])
+        fig_treemap.update_traces(
+            textinfo='label+percent root',
+            hovertemplate="<b>País:</b> %{customdata[2]}<br><b>KG Importado:</b> %{customdata[0]}<br><b>Participação:</b> %{customdata[1]}<extra></extra>"
+        )
+    fig_treemap.update_layout(margin = dict(t=50, l=25, r=25, b=25))
+    return fig_treemap
+
+def build_groups_comparison_figure(comparison: pd.DataFrame, metric_label: str, compact: bool = COMPACT_FIGURES):
+    """Linhas mensais de todos os grupos para uma métrica; None se não houver valores."""
+    if comparison.empty or not comparison.to_numpy().any():
+        return None
+    x = comparison.index
+    fig = go.Figure()
+    with stage("rotulos_hover:grupos", linhas=comparison.size):
+        for group_name in comparison.columns:
+            series = comparison[group_name]
+            hover_data, hover_value = _hover(series, 0, compact)
+            fig.add_trace(go.Scatter(x=x, y=_compact_values(series) if compact else series,
+                                     name=str(group_name), mode='lines+markers', marker=dict(size=4),
+                                     customdata=hover_data,
+                                     hovertemplate=f"{group_name}: {hover_value}<extra></extra>"))
+    fig.update_layout(title=f"<b>Comparação entre grupos - {metric_label}</b>",
+                      xaxis_title="Mês/Ano", yaxis_title=metric_label,
+                      hovermode="x unified", plot_bgcolor='white')
+    fig.update_xaxes(categoryorder='array', categoryarray=list(x),
+                     showgrid=True, gridwidth=1, gridcolor='LightGrey', griddash='dot')
+    _apply_y_axis(fig, comparison.to_numpy().max(), compact)
+    if compact:
+        _apply_compact_layout(fig)
+    return fig
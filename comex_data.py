@@ -0,0 +1,535 @@
+# coding: utf-8
+# Camada de ingestão dos dados do Comex Stat: leitura da planilha, limpeza e
+# cache colunar em disco (Parquet) do DataFrame já limpo.
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+from comex_fetch import is_url, fetch_source
+
+# Copy-on-Write: fatias e seleções de colunas compartilham a memória do DataFrame
+# de origem até serem modificadas, e uma modificação nunca altera o original.
+# Permite manter os dados uma única vez por processo e entregar visões somente
+# leitura a cada sessão do dashboard. Sempre ativo a partir do pandas 3.0.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# --- Constantes ---
+# Fonte da planilha (URL ou caminho local); pode ser sobrescrita pela variável de ambiente.
+FILE_PATH = os.environ.get("COMEX_FONTE", 'https://raw.githubusercontent.com/rdzomer/Analise-Mensal/refs/heads/main/H_EXPORTACAO_E%20IMPORTACAO_GERAL_2024-01_2025-12_DT20250506.xlsx')
+SHEET_NAME = 'Resultado'
+
+COL_MES = 'Mês'
+COL_NCM_CODIGO = 'Código NCM'
+COL_NCM_DESCRICAO = 'Descrição NCM'
+COL_PAIS = 'Países'
+COL_EXPORT_VALOR_FORMAT = "Exportação - {} - Valor US$ FOB"
+COL_EXPORT_KG_FORMAT = "Exportação - {} - Quilograma Líquido"
+COL_IMPORT_VALOR_FORMAT = "Importação - {} - Valor US$ FOB"
+COL_IMPORT_KG_FORMAT = "Importação - {} - Quilograma Líquido"
+
+# Colunas de valor da tabela longa (fluxo × métrica) e o formato de origem na planilha.
+VALUE_COLUMN_FORMATS = {
+    "Exportacao_kg": COL_EXPORT_KG_FORMAT,
+    "Exportacao_usd": COL_EXPORT_VALOR_FORMAT,
+    "Importacao_kg": COL_IMPORT_KG_FORMAT,
+    "Importacao_usd": COL_IMPORT_VALOR_FORMAT,
+}
+VALUE_COLUMNS = list(VALUE_COLUMN_FORMATS)
+YEAR_COLUMN_PATTERNS = {
+    value_col: re.compile("^" + re.escape(col_format).replace(re.escape("{}"), r"(\d{4})") + "$")
+    for value_col, col_format in VALUE_COLUMN_FORMATS.items()
+}
+KEY_COLUMNS = [COL_NCM_CODIGO, COL_NCM_DESCRICAO, COL_PAIS]
+
+PAIS_CHINA = 'CHINA'
+
+# Arquivo JSON com os grupos de NCMs ({"grupo": {"descricao": ..., "ncms": [...]}}).
+# O arquivo versionado no repositório é apenas a semente: as edições feitas no
+# dashboard são gravadas em GROUPS_FILE, no diretório de dados local (ambos
+# podem ser sobrescritos pelas variáveis de ambiente).
+GROUPS_SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ncm_groups.json")
+DATA_DIR = os.environ.get("COMEX_DADOS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados"))
+GROUPS_FILE = os.environ.get("COMEX_GRUPOS_FILE", os.path.join(DATA_DIR, "ncm_groups.json"))
+
+# Colunas do cubo agregado NCM × ano × mês.
+CUBE_INDEX = [COL_NCM_CODIGO, "Ano", "month_num"]
+CUBE_COLUMNS = [
+    "Exportacao_kg", "Importacao_kg_Total", "Importacao_kg_China",
+    "Importacao_usd_Total", "Importacao_usd_China",
+]
+
+# Colunas da tabela de origem das importações (NCM × país × ano).
+ORIGIN_COLUMNS = [COL_NCM_CODIGO, COL_PAIS, "Ano", "Importacao_kg", "participacao", "rank"]
+
+# Níveis da hierarquia NCM e número de dígitos do código em cada um.
+NIVEIS_NCM = {"Capítulo": 2, "Posição": 4, "Subposição": 6, "NCM": 8}
+
+# Diretório do cache colunar. Pode ser sobrescrito pela variável de ambiente.
+CACHE_DIR = os.environ.get("COMEX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+# Incrementar sempre que clean_data mudar: invalida os caches já gravados.
+PIPELINE_VERSION = 3
+
+MESES_MAP = {
+    unidecode(k.split('. ')[1].upper()): int(k.split('. ')[0])
+    for k in [
+        "01. Janeiro", "02. Fevereiro", "03. Março", "04. Abril",
+        "05. Maio", "06. Junho", "07. Julho", "08. Agosto",
+        "09. Setembro", "10. Outubro", "11. Novembro", "12. Dezembro"
+    ]
+}
+MESES_NUM_TO_NOME_ABBR = {
+    1: "Jan", 2: "Fev", 3: "Mar", 4: "Abr", 5: "Mai", 6: "Jun",
+    7: "Jul", 8: "Ago", 9: "Set", 10: "Out", 11: "Nov", 12: "Dez"
+}
+
+def read_raw_excel(source, sheet_name: str) -> pd.DataFrame:
+    return pd.read_excel(source, sheet_name=sheet_name, engine='openpyxl')
+
+def read_long_data(source, sheet_name: str) -> pd.DataFrame:
+    # Planilha -> limpeza -> tabela longa, sem cache.
+    return to_long_format(clean_data(read_raw_excel(source, sheet_name)))
+
+def _normalize_month_label(label) -> str:
+    if isinstance(label, str) and '. ' in label:
+        return unidecode(label.split('. ')[1].upper())
+    return unidecode(str(label).upper())
+
+def _categorical_map(series: pd.Series, func) -> pd.Series:
+    # Aplica func apenas aos valores únicos e propaga o resultado pelos códigos
+    # da categoria, em vez de chamar func linha a linha.
+    categorical = series.astype("category")
+    new_labels = pd.Index([func(label) for label in categorical.cat.categories])
+    new_categories, inverse = np.unique(new_labels.to_numpy(dtype=object), return_inverse=True)
+    codes = categorical.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, inverse[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=new_categories), index=series.index, name=series.name)
+
+def _downcast_numeric(series: pd.Series) -> pd.Series:
+    numeric = pd.to_numeric(series, errors='coerce').fillna(0)
+    if numeric.dtype.kind == "f" and not np.array_equal(numeric.to_numpy(), np.floor(numeric.to_numpy())):
+        # Valores fracionários permanecem em float64 para não perder precisão nas somas.
+        return numeric
+    return pd.to_numeric(numeric.astype("int64"), downcast="integer")
+
+def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Limpa a aba de resultados do Comex Stat sem copiar o DataFrame bruto.
+
+    Meses, países, códigos e descrições NCM são normalizados apenas sobre os
+    valores únicos e armazenados como categorias; as colunas de kg e US$ são
+    reduzidas ao menor tipo inteiro que comporta os valores.
+    """
+    row_mask = np.ones(len(df), dtype=bool)
+    cleaned = {}
+    if COL_MES in df.columns:
+        month_labels = df[COL_MES].astype("category")
+        month_lookup = np.array(
+            [MESES_MAP.get(_normalize_month_label(label), 0) for label in month_labels.cat.categories] + [0],
+            dtype=np.int8,
+        )
+        # Código -1 (valor ausente) aponta para o último elemento (0 = mês inválido).
+        month_num = month_lookup[month_labels.cat.codes.to_numpy()]
+        row_mask &= month_num > 0
+        cleaned[COL_MES] = month_labels
+        cleaned["month_num"] = pd.Series(month_num, index=df.index)
+
+    if COL_NCM_CODIGO in df.columns:
+        cleaned[COL_NCM_CODIGO] = _categorical_map(df[COL_NCM_CODIGO], lambda x: str(x).replace('.', ''))
+    if COL_NCM_DESCRICAO in df.columns:
+        cleaned[COL_NCM_DESCRICAO] = df[COL_NCM_DESCRICAO].astype("category")
+    if COL_PAIS in df.columns:
+        cleaned[COL_PAIS] = _categorical_map(df[COL_PAIS], lambda x: str(x).strip().upper())
+
+    for col_name in detect_year_columns(df.columns).values():
+        cleaned[col_name] = _downcast_numeric(df[col_name])
+
+    df_cleaned = pd.DataFrame(cleaned, index=df.index)
+    if not row_mask.all():
+        df_cleaned = df_cleaned[row_mask]
+    return df_cleaned.reset_index(drop=True)
+
+def detect_year_columns(columns) -> dict:
+    """Mapeia (coluna de valor, ano) -> coluna da planilha para todo ano presente."""
+    year_columns = {}
+    for col_name in columns:
+        for value_col, pattern in YEAR_COLUMN_PATTERNS.items():
+            match = pattern.match(str(col_name))
+            if match:
+                year_columns[(value_col, int(match.group(1)))] = col_name
+                break
+    return year_columns
+
+def to_long_format(df_cleaned: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas "Exportação/Importação - {ano} - ..." em uma tabela longa.
+
+    Cada linha passa a ser (NCM, país, ano, mês) com as colunas de valor de
+    VALUE_COLUMNS (fluxo × métrica). A conversão é feita de uma só vez com NumPy,
+    qualquer que seja o número de anos; linhas sem nenhum valor são descartadas.
+    """
+    year_columns = detect_year_columns(df_cleaned.columns)
+    years = sorted({year for _, year in year_columns})
+    key_cols = [col for col in KEY_COLUMNS if col in df_cleaned.columns]
+    if not years or "month_num" not in df_cleaned.columns:
+        return pd.DataFrame(columns=key_cols + ["Ano", "month_num"] + VALUE_COLUMNS)
+
+    n_rows = len(df_cleaned)
+    long_data = {}
+    for col in key_cols:
+        # Chaves categóricas: repete apenas os códigos inteiros, um bloco por ano.
+        categorical = df_cleaned[col].astype("category")
+        long_data[col] = pd.Categorical.from_codes(
+            np.tile(categorical.cat.codes.to_numpy(), len(years)), categories=categorical.cat.categories
+        )
+    long_data["Ano"] = np.repeat(np.array(years, dtype=np.int16), n_rows)
+    month_num = df_cleaned["month_num"].to_numpy()
+    long_data["month_num"] = np.tile(month_num, len(years))
+    for value_col in VALUE_COLUMNS:
+        blocks = []
+        for year in years:
+            col_name = year_columns.get((value_col, year))
+            blocks.append(df_cleaned[col_name].to_numpy() if col_name else np.zeros(n_rows, dtype=np.int8))
+        long_data[value_col] = np.concatenate(blocks)
+
+    df_long = pd.DataFrame(long_data)
+    has_value = (df_long[VALUE_COLUMNS] != 0).any(axis=1).to_numpy()
+    return df_long[has_value].reset_index(drop=True)
+
+# --- Cache colunar ---
+def _digest(*parts) -> str:
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+def _cache_path(source, sheet_name: str, fingerprint: str, cache_dir: str) -> str:
+    source_id = _digest(os.path.abspath(source) if not is_url(source) else source, sheet_name)
+    return os.path.join(cache_dir, f"{source_id}-{_digest(fingerprint, PIPELINE_VERSION)}.parquet")
+
+def _read_cache(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        # Cache corrompido ou engine Parquet indisponível: reconstrói a partir da fonte.
+        return None
+
+def _write_cache(df: pd.DataFrame, path: str) -> None:
+    cache_dir = os.path.dirname(path)
+    source_id = os.path.basename(path).split("-")[0]
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        # Remove versões antigas do cache da mesma fonte.
+        for name in os.listdir(cache_dir):
+            if name.startswith(source_id + "-") and name.endswith(".parquet") and name != os.path.basename(path):
+                os.remove(os.path.join(cache_dir, name))
+    except Exception:
+        # Falha ao gravar o cache não impede o uso dos dados já carregados.
+        pass
+
+def load_cleaned_data(source, sheet_name: str, cache_dir: str = CACHE_DIR, max_age: float = 0) -> pd.DataFrame:
+    """Retorna a tabela longa já limpa, usando o cache Parquet quando a fonte não mudou.
+
+    Arquivos locais são identificados por mtime e tamanho; URLs são obtidas pela
+    camada de download (comex_fetch), com cópia local em cache_dir/downloads e
+    identificadas pelo hash SHA-256 do conteúdo; max_age (segundos) dispensa a
+    revalidação de uma cópia verificada há pouco. A planilha só é reprocessada
+    com openpyxl quando a fonte (ou PIPELINE_VERSION) muda.
+    """
+    excel_source, fingerprint = fetch_source(source, os.path.join(cache_dir, "downloads"), max_age=max_age)
+    path = _cache_path(source, sheet_name, fingerprint, cache_dir)
+    df_cached = _read_cache(path)
+    if df_cached is not None:
+        return df_cached
+
+    df_long = read_long_data(excel_source, sheet_name)
+    _write_cache(df_long, path)
+    return df_long
+
+# --- Cubo agregado ---
+def build_aggregate_cube(df_long: pd.DataFrame, complete: bool = True) -> pd.DataFrame:
+    """Agrega a tabela longa uma única vez por (NCM, ano, mês).
+
+    Soma exportação (kg) e importação total e da China (kg e US$ FOB) sobre
+    todos os países em um único groupby, para qualquer número de anos. Cada NCM
+    recebe todos os períodos (ano × mês) da planilha, com zero onde não há
+    registro, como na planilha original de colunas por ano; o
+    índice fica ordenado, de modo que a seleção de um NCM ou grupo é um
+    fatiamento do índice seguido de uma soma (ver select_series).
+
+    Com complete=False devolve apenas as combinações observadas (usado para os
+    cubos parciais de cada partição do armazenamento incremental).
+    """
+    empty_cube = pd.DataFrame(columns=CUBE_INDEX + CUBE_COLUMNS).set_index(CUBE_INDEX)
+    required_cols = [COL_NCM_CODIGO, COL_PAIS, "Ano", "month_num", "Exportacao_kg", "Importacao_kg", "Importacao_usd"]
+    if df_long.empty or any(col not in df_long.columns for col in required_cols):
+        return empty_cube
+    df_months = df_long[(df_long["month_num"] >= 1) & (df_long["month_num"] <= 12)]
+    is_china = df_months[COL_PAIS] == PAIS_CHINA
+    df_flows = pd.DataFrame({
+        COL_NCM_CODIGO: df_months[COL_NCM_CODIGO],
+        "Ano": df_months["Ano"],
+        "month_num": df_months["month_num"],
+        "Exportacao_kg": df_months["Exportacao_kg"],
+        "Importacao_kg_Total": df_months["Importacao_kg"],
+        "Importacao_kg_China": df_months["Importacao_kg"].where(is_china, 0),
+        "Importacao_usd_Total": df_months["Importacao_usd"],
+        "Importacao_usd_China": df_months["Importacao_usd"].where(is_china, 0),
+    })
+    cube = df_flows.groupby(CUBE_INDEX, sort=False, observed=True)[CUBE_COLUMNS].sum()
+    return complete_cube_periods(cube) if complete else cube.sort_index()
+
+def complete_cube_periods(cube: pd.DataFrame) -> pd.DataFrame:
+    """Estende o cubo para todos os NCMs × anos × meses presentes, com zero onde faltar."""
+    full_index = pd.MultiIndex.from_product(
+        [cube.index.unique(level=level) for level in CUBE_INDEX], names=CUBE_INDEX
+    )
+    return cube.reindex(full_index, fill_value=0).sort_index()
+
+def select_series(cube: pd.DataFrame, ncms: list) -> pd.DataFrame:
+    """Série mensal (Ano, month_num) somada para a lista de NCMs a partir do cubo."""
+    available_ncms = cube.index.unique(level=COL_NCM_CODIGO)
+    ncms_present = [ncm for ncm in ncms if ncm in available_ncms]
+    if not ncms_present:
+        return pd.DataFrame(columns=["Ano", "month_num"] + CUBE_COLUMNS)
+    df_slice = cube.loc[pd.IndexSlice[ncms_present, :, :], :]
+    return df_slice.groupby(level=["Ano", "month_num"], observed=True)[CUBE_COLUMNS].sum().reset_index()
+
+# --- Origem das importações ---
+def build_origin_table(df_long: pd.DataFrame) -> pd.DataFrame:
+    """Importação (kg) por NCM × país × ano, com participação (%) e posição do país.
+
+    Construída uma única vez na carga; a participação e o rank são relativos ao
+    total do NCM no ano. Contém só as combinações com importação, ordenadas por
+    NCM, ano e rank, e é muito menor que a tabela longa (sem meses e sem
+    exportação), de modo que treemaps, rankings e comparações entre anos são
+    filtros e somas sobre ela.
+    """
+    required_cols = [COL_NCM_CODIGO, COL_PAIS, "Ano", "Importacao_kg"]
+    if df_long.empty or any(col not in df_long.columns for col in required_cols):
+        return pd.DataFrame(columns=ORIGIN_COLUMNS)
+    imports = df_long.loc[df_long["Importacao_kg"] > 0, required_cols]
+    table = (
+        imports.groupby([COL_NCM_CODIGO, "Ano", COL_PAIS], observed=True, sort=False)["Importacao_kg"].sum()
+        .astype("float64").reset_index()
+    )
+    by_ncm_year = table.groupby([COL_NCM_CODIGO, "Ano"], observed=True, sort=False)["Importacao_kg"]
+    table["participacao"] = table["Importacao_kg"] / by_ncm_year.transform("sum") * 100
+    table["rank"] = by_ncm_year.rank(method="first", ascending=False).astype("int32")
+    return table.sort_values(by=[COL_NCM_CODIGO, "Ano", "rank"]).reset_index(drop=True)[ORIGIN_COLUMNS]
+
+def country_share_gains(origin_table: pd.DataFrame, ano_inicial: int, ano_final: int, ncms=None) -> pd.DataFrame:
+    """Variação da participação (p.p.) de cada país em cada NCM entre dois anos.
+
+    Considera só NCMs com importação nos dois anos (sem importação, a
+    participação do ano é indefinida, não 0%). Uma linha por NCM × país presente
+    em algum dos dois anos, ordenada do maior ganho para a maior perda; um país
+    ausente de um desses NCMs em um dos anos entra com 0% naquele ano.
+    """
+    columns = [COL_NCM_CODIGO, COL_PAIS, "participacao_inicial", "participacao_final", "variacao_pp", "Importacao_kg_final"]
+    table = origin_table[origin_table["Ano"].isin([ano_inicial, ano_final])]
+    if ncms is not None:
+        table = table[table[COL_NCM_CODIGO].isin(ncms)]
+    # A tabela de origem só tem linhas com importação: o NCM precisa aparecer nos dois anos.
+    anos_por_ncm = table.groupby(COL_NCM_CODIGO, observed=True)["Ano"].nunique()
+    ncms_comparaveis = anos_por_ncm.index[anos_por_ncm == len({ano_inicial, ano_final})]
+    table = table[table[COL_NCM_CODIGO].isin(ncms_comparaveis)]
+    if table.empty:
+        return pd.DataFrame(columns=columns)
+    wide = (
+        table.set_index([COL_NCM_CODIGO, COL_PAIS, "Ano"])[["participacao", "Importacao_kg"]]
+        .unstack("Ano", fill_value=0)
+        .reindex(columns=pd.MultiIndex.from_product([["participacao", "Importacao_kg"], [ano_inicial, ano_final]]), fill_value=0)
+    )
+    gains = pd.DataFrame({
+        "participacao_inicial": wide[("participacao", ano_inicial)],
+        "participacao_final": wide[("participacao", ano_final)],
+        "Importacao_kg_final": wide[("Importacao_kg", ano_final)],
+    })
+    gains["variacao_pp"] = gains["participacao_final"] - gains["participacao_inicial"]
+    return gains.reset_index().sort_values(by="variacao_pp", ascending=False, kind="stable")[columns].reset_index(drop=True)
+
+# --- Hierarquia NCM e índice de busca ---
+def build_hierarchy_cube(cube: pd.DataFrame) -> pd.DataFrame:
+    """Cubo com as séries de todos os níveis da hierarquia NCM já materializadas.
+
+    Além dos NCMs (8 dígitos), inclui capítulo (2), posição (4) e subposição (6),
+    cada um como uma chave própria no primeiro nível do índice; selecionar
+    "7208" custa o mesmo que selecionar um NCM.
+    """
+    if cube.empty:
+        return cube
+    flat = cube.reset_index()
+    codes = flat[COL_NCM_CODIGO].astype(str)
+    levels = [flat.assign(**{COL_NCM_CODIGO: codes})]
+    for digits in sorted(set(NIVEIS_NCM.values()) - {NIVEIS_NCM["NCM"]}):
+        levels.append(
+            flat.assign(**{COL_NCM_CODIGO: codes.str[:digits]})
+            .groupby(CUBE_INDEX, sort=False)[CUBE_COLUMNS].sum().reset_index()
+        )
+    return pd.concat(levels, ignore_index=True).set_index(CUBE_INDEX).sort_index()
+
+def _format_codigo(codigo: str) -> str:
+    # 72083700 -> 7208.37.00; 720837 -> 7208.37
+    return ".".join([codigo[:4]] + [codigo[i:i + 2] for i in range(4, len(codigo), 2)])
+
+def build_ncm_index(df_long: pd.DataFrame) -> pd.DataFrame:
+    """Índice de todas as chaves selecionáveis (capítulo, posição, subposição e NCM).
+
+    Colunas: chave, nivel, descricao, rotulo (texto do seletor), busca (rótulo
+    normalizado em minúsculas e sem acentos) e n_ncms. Construído uma única vez.
+    """
+    columns = ["chave", "nivel", "descricao", "rotulo", "busca", "n_ncms"]
+    if df_long.empty or COL_NCM_CODIGO not in df_long.columns:
+        return pd.DataFrame(columns=columns)
+    ncms = (
+        df_long[[COL_NCM_CODIGO, COL_NCM_DESCRICAO]].drop_duplicates(subset=[COL_NCM_CODIGO])
+        .astype(str).sort_values(by=COL_NCM_CODIGO).reset_index(drop=True)
+    )
+    frames = [pd.DataFrame({
+        "chave": ncms[COL_NCM_CODIGO],
+        "nivel": "NCM",
+        "descricao": ncms[COL_NCM_DESCRICAO],
+        "n_ncms": 1,
+    })]
+    for nivel, digits in NIVEIS_NCM.items():
+        if nivel == "NCM":
+            continue
+        counts = ncms[COL_NCM_CODIGO].str[:digits].value_counts().sort_index()
+        frames.append(pd.DataFrame({
+            "chave": counts.index,
+            "nivel": nivel,
+            "descricao": [f"{nivel} {_format_codigo(chave) if digits > 2 else chave} ({n} NCMs)" for chave, n in counts.items()],
+            "n_ncms": counts.to_numpy(),
+        }))
+    index = pd.concat(frames, ignore_index=True).sort_values(by="chave", kind="stable").reset_index(drop=True)
+    index["rotulo"] = index["chave"] + " - " + index["descricao"]
+    unique_labels = index["rotulo"].unique()
+    normalized = dict(zip(unique_labels, (unidecode(label).lower() for label in unique_labels)))
+    index["busca"] = index["rotulo"].map(normalized)
+    index["nivel"] = index["nivel"].astype("category")
+    return index[columns]
+
+def search_ncm_index(ncm_index: pd.DataFrame, termo: str = "", niveis=None) -> pd.DataFrame:
+    """Filtra o índice por prefixo de código (com ou sem pontos) ou por trecho da descrição.
+
+    niveis=None não filtra por nível; uma lista vazia não devolve nenhuma chave.
+    """
+    result = ncm_index
+    if niveis is not None:
+        result = result[result["nivel"].isin(niveis)]
+    termo = unidecode(termo or "").strip().lower()
+    if termo:
+        termo_codigo = termo.replace(".", "")
+        mask = result["busca"].str.contains(termo, regex=False)
+        if termo_codigo.isdigit():
+            mask |= result["chave"].str.startswith(termo_codigo)
+        result = result[mask]
+    return result
+
+def ncms_for_key(key: str, ncm_codes) -> list:
+    """NCMs (8 dígitos) cobertos por uma chave de qualquer nível da hierarquia."""
+    codes = pd.Index(ncm_codes).astype(str)
+    return list(codes[codes.str.startswith(str(key))])
+
+# --- Grupos de NCMs ---
+def normalize_ncm_code(code) -> str:
+    """Código NCM só com dígitos (aceita "7305.11.00")."""
+    return re.sub(r"\D", "", str(code))
+
+def parse_groups_config(config: dict) -> tuple:
+    """Valida a configuração de grupos e devolve (grupos -> NCMs, grupos -> descrição).
+
+    Qualquer problema de estrutura ou de conteúdo levanta ValueError.
+    """
+    if not isinstance(config, dict):
+        raise ValueError('A configuração deve ser um objeto {"grupo": {"descricao": ..., "ncms": [...]}}.')
+    groups, descriptions = {}, {}
+    for group_name, group in config.items():
+        group_name = str(group_name).strip()
+        if not group_name:
+            raise ValueError("Grupo sem nome na configuração.")
+        if group_name.isdigit():
+            # Só dígitos confundiria o grupo com uma chave da hierarquia NCM (ex.: "7208").
+            raise ValueError(f"Grupo '{group_name}': o nome não pode ter só dígitos, para não coincidir com um código NCM.")
+        if not isinstance(group, dict):
+            raise ValueError(f'Grupo \'{group_name}\': esperado um objeto {{"descricao": ..., "ncms": [...]}}.')
+        raw_ncms = group.get("ncms", [])
+        if not isinstance(raw_ncms, list):
+            raise ValueError(f"Grupo '{group_name}': \"ncms\" deve ser uma lista de códigos.")
+        ncms = [normalize_ncm_code(ncm) for ncm in raw_ncms]
+        invalid = [ncm for ncm in ncms if len(ncm) != NIVEIS_NCM["NCM"]]
+        if invalid or not ncms:
+            raise ValueError(f"Grupo '{group_name}': informe NCMs de 8 dígitos (inválidos: {', '.join(invalid) or 'nenhum NCM'}).")
+        groups[group_name] = list(dict.fromkeys(ncms))
+        descriptions[group_name] = str(group.get("descricao") or f"Agregado do grupo {group_name}")
+    return groups, descriptions
+
+def load_ncm_groups(path: str = GROUPS_FILE, seed_path: str = GROUPS_SEED_FILE) -> tuple:
+    """Grupos de NCMs do arquivo de configuração.
+
+    Enquanto path não existir (nenhuma edição salva), usa o arquivo semente;
+    sem nenhum dos dois, não há grupos.
+    """
+    if not os.path.exists(path):
+        path = seed_path
+    if not path or not os.path.exists(path):
+        return {}, {}
+    with open(path, encoding="utf-8") as f:
+        return parse_groups_config(json.load(f))
+
+def save_ncm_groups(groups: dict, descriptions: dict, path: str = GROUPS_FILE) -> None:
+    """Grava os grupos no arquivo de configuração (substituição atômica)."""
+    config = {
+        group_name: {"descricao": descriptions.get(group_name, ""), "ncms": list(ncms)}
+        for group_name, ncms in groups.items()
+    }
+    parse_groups_config(config)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Sessões do Streamlit são threads do mesmo processo: o temporário leva também a thread.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+def build_group_membership(groups: dict, ncm_codes) -> np.ndarray:
+    """Matriz de pertinência grupos × NCMs (1 se o NCM pertence ao grupo)."""
+    codes = pd.Index(ncm_codes).astype(str)
+    membership = np.zeros((len(groups), len(codes)))
+    for row, ncms in enumerate(groups.values()):
+        positions = codes.get_indexer(list(ncms))
+        membership[row, positions[positions >= 0]] = 1
+    return membership
+
+def build_group_cube(cube: pd.DataFrame, groups: dict) -> pd.DataFrame:
+    """Séries de todos os grupos de uma vez, no mesmo formato do cubo.
+
+    Os NCMs (8 dígitos) do cubo são dispostos como uma matriz NCMs × (coluna,
+    ano, mês) e multiplicados pela matriz de pertinência: um único produto
+    calcula todos os grupos, e um grupo a mais é só uma linha a mais. O primeiro
+    nível do índice traz o nome do grupo, então select_series funciona igual.
+    """
+    empty_cube = pd.DataFrame(columns=CUBE_INDEX + CUBE_COLUMNS).set_index(CUBE_INDEX)
+    if cube.empty or not groups:
+        return empty_cube
+    codes = cube.index.get_level_values(COL_NCM_CODIGO).astype(str)
+    ncm_cube = cube[codes.str.len() == NIVEIS_NCM["NCM"]]
+    wide = ncm_cube[CUBE_COLUMNS].unstack(["Ano", "month_num"], fill_value=0)
+    periods = wide[CUBE_COLUMNS[0]].columns
+    membership = build_group_membership(groups, wide.index)
+    # (grupos × NCMs) @ (NCMs × colunas·períodos) -> (grupos × colunas·períodos)
+    sums = membership @ wide[CUBE_COLUMNS].to_numpy(dtype="float64")
+    sums = sums.reshape(len(groups), len(CUBE_COLUMNS), len(periods)).transpose(0, 2, 1)
+    index = pd.MultiIndex.from_arrays([
+        np.repeat(list(groups), len(periods)),
+        np.tile(periods.get_level_values("Ano"), len(groups)),
+        np.tile(periods.get_level_values("month_num"), len(groups)),
+    ], names=CUBE_INDEX)
+    return pd.DataFrame(sums.reshape(-1, len(CUBE_COLUMNS)), index=index, columns=CUBE_COLUMNS).sort_index()
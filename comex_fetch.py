@@ -0,0 +1,209 @@
+# coding: utf-8
+# Obtenção da planilha de origem: cópia local em disco, requisições condicionais
+# (ETag / Last-Modified) com timeout e revalidação periódica em segundo plano.
+#
+# A fonte é uma URL (http/https) ou um caminho local; o dashboard usa a
+# variável de ambiente COMEX_FONTE (ver comex_data.FILE_PATH), o que permite
+# apontar para um servidor HTTP local ou para um arquivo em testes e em
+# instalações sem acesso à internet.
+#
+# Cada download é gravado com o hash do conteúdo no nome e só então o arquivo
+# de metadados passa a apontar para ele, de modo que quem está lendo a versão
+# anterior nunca vê um arquivo parcial. Se a revalidação falhar (rede fora do
+# ar, timeout, erro HTTP), a última cópia local continua sendo usada.
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+logger = logging.getLogger("comex.fetch")
+
+# Timeout (segundos) de cada requisição à fonte remota.
+FETCH_TIMEOUT = float(os.environ.get("COMEX_FONTE_TIMEOUT", 30))
+# Intervalo (segundos) entre revalidações em segundo plano; 0 desativa.
+REFRESH_INTERVAL = int(os.environ.get("COMEX_FONTE_ATUALIZACAO", 900))
+# Cópias baixadas mantidas por fonte (a atual e a anterior).
+KEEP_DOWNLOADS = 2
+
+def is_url(path: str) -> bool:
+    return str(path).startswith(("http://", "https://"))
+
+def _local_fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+def _meta_path(source: str, cache_dir: str) -> str:
+    source_id = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{source_id}.json")
+
+def _read_meta(meta_path: str) -> dict:
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Metadados sem o arquivo correspondente equivalem a não ter cópia local.
+    if not os.path.exists(os.path.join(os.path.dirname(meta_path), meta.get("arquivo", ""))):
+        return {}
+    return meta
+
+def _write_meta(meta: dict, meta_path: str) -> None:
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+def _store_download(content: bytes, sha256: str, meta_path: str) -> str:
+    cache_dir = os.path.dirname(meta_path)
+    prefix = os.path.basename(meta_path)[:-len(".json")]
+    file_name = f"{prefix}-{sha256[:16]}.xlsx"
+    path = os.path.join(cache_dir, file_name)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return file_name
+
+def _prune_downloads(meta_path: str, current: str) -> None:
+    # Remove as cópias mais antigas da mesma fonte, mantendo KEEP_DOWNLOADS e a atual.
+    cache_dir = os.path.dirname(meta_path)
+    prefix = os.path.basename(meta_path)[:-len(".json")] + "-"
+    downloads = sorted(
+        (os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+         if name.startswith(prefix) and name.endswith(".xlsx") and name != current),
+        key=os.path.getmtime,
+    )
+    for path in downloads[:max(len(downloads) - (KEEP_DOWNLOADS - 1), 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def fetch_source(source, cache_dir: str, timeout: float = FETCH_TIMEOUT, max_age: float = 0) -> tuple:
+    """Devolve (caminho local, impressão digital) da versão atual da fonte.
+
+    Caminhos locais são usados diretamente, identificados por mtime e tamanho.
+    URLs são baixadas para cache_dir e identificadas pelo SHA-256 do conteúdo;
+    se a cópia local foi verificada há menos de max_age segundos, não há acesso
+    à rede. Caso contrário a fonte é revalidada com If-None-Match /
+    If-Modified-Since (resposta 304 reaproveita a cópia). Falhas de rede só
+    propagam a exceção quando ainda não existe cópia local.
+    """
+    if not is_url(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(source)
+        return source, _local_fingerprint(source)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = _meta_path(source, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta and time.time() - meta.get("verificado_em", 0) < max_age:
+        return os.path.join(cache_dir, meta["arquivo"]), meta["sha256"]
+
+    request = urllib.request.Request(source)
+    if meta.get("etag"):
+        request.add_header("If-None-Match", meta["etag"])
+    if meta.get("last_modified"):
+        request.add_header("If-Modified-Since", meta["last_modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content = response.read()
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and meta:
+            meta["verificado_em"] = time.time()
+            _write_meta(meta, meta_path)
+            return os.path.join(cache_dir, meta["arquivo"]), meta["sha256"]
+        if not meta:
+            raise
+        logger.warning("Fonte %s respondeu HTTP %s; usando a cópia local de %s", source, e.code, meta.get("baixado_em"))
+        return os.path.join(cache_dir, meta["arquivo"]), meta["sha256"]
+    except (urllib.error.URLError, OSError) as e:
+        if not meta:
+            raise
+        logger.warning("Falha ao revalidar %s (%s); usando a cópia local de %s", source, e, meta.get("baixado_em"))
+        return os.path.join(cache_dir, meta["arquivo"]), meta["sha256"]
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    now = time.time()
+    meta = {
+        "fonte": source,
+        "arquivo": _store_download(content, sha256, meta_path),
+        "sha256": sha256,
+        "etag": etag,
+        "last_modified": last_modified,
+        "baixado_em": meta["baixado_em"] if meta.get("sha256") == sha256 else datetime.now().isoformat(timespec="seconds"),
+        "verificado_em": now,
+    }
+    _write_meta(meta, meta_path)
+    _prune_downloads(meta_path, meta["arquivo"])
+    return os.path.join(cache_dir, meta["arquivo"]), sha256
+
+class SourceRefresher:
+    """Revalida a fonte periodicamente em uma thread e publica novas versões.
+
+    version é a impressão digital da versão em uso. Quando a fonte muda,
+    on_new_version(versão) é chamado antes da publicação (para carregar e
+    agregar a nova versão em segundo plano); só depois version passa a
+    devolver a versão nova, de uma vez, para todas as sessões.
+    """
+
+    def __init__(self, source, cache_dir: str, interval: float = REFRESH_INTERVAL,
+                 timeout: float = FETCH_TIMEOUT, on_new_version=None):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.timeout = timeout
+        self.on_new_version = on_new_version
+        self._version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self) -> str:
+        with self._lock:
+            return self._version
+
+    def _publish(self, version: str) -> None:
+        with self._lock:
+            self._version = version
+
+    def check(self) -> bool:
+        """Revalida a fonte agora; devolve True se uma nova versão foi publicada."""
+        _, fingerprint = fetch_source(self.source, self.cache_dir, self.timeout)
+        if fingerprint == self.version:
+            return False
+        if self.on_new_version is not None:
+            self.on_new_version(fingerprint)
+        self._publish(fingerprint)
+        logger.info("Nova versão da fonte %s publicada: %s", self.source, fingerprint)
+        return True
+
+    def start(self) -> "SourceRefresher":
+        """Publica a versão disponível (a cópia local, se houver) e inicia a revalidação."""
+        # A primeira versão vem da cópia em disco, sem esperar pela rede, quando ela existe.
+        _, fingerprint = fetch_source(self.source, self.cache_dir, self.timeout, max_age=float("inf"))
+        self._publish(fingerprint)
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="comex-fonte", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        # Primeira revalidação imediata; depois, a cada intervalo.
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Falha ao atualizar a fonte %s", self.source)
+            self._stop.wait(self.interval)
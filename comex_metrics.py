@@ -0,0 +1,121 @@
+# coding: utf-8
+# Instrumentação opcional por etapa: tempo de parede, linhas e variação de
+# memória (RSS) de cada etapa do pipeline e de cada gráfico.
+#
+# Ativada com COMEX_INSTRUMENTACAO=1 (ou ?instrumentacao=1 na URL do dashboard).
+# Cada etapa é registrada como uma linha JSON no logger "comex.metrics"; se
+# COMEX_METRICS_FILE estiver definido, os totais acumulados no processo também
+# são gravados nesse arquivo no formato texto do Prometheus (coletor textfile
+# do node_exporter).
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("comex.metrics")
+
+ENABLED_BY_ENV = os.environ.get("COMEX_INSTRUMENTACAO", "").lower() in ("1", "true", "sim")
+METRICS_FILE = os.environ.get("COMEX_METRICS_FILE")
+
+_current_recorder = contextvars.ContextVar("comex_recorder", default=None)
+# Totais por etapa acumulados no processo (todas as sessões).
+_totals = {}
+_totals_lock = threading.Lock()
+
+def _current_rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class StageRecorder:
+    """Registros de uma execução (rerun) do dashboard ou de um lote."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str, **info):
+        if not self.enabled:
+            yield info
+            return
+        rss_before = _current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            rss_after = _current_rss_mb()
+            record = {
+                "etapa": name,
+                "tempo_ms": round(elapsed_ms, 2),
+                "linhas": info.get("linhas"),
+                "mem_delta_mb": round(rss_after - rss_before, 2) if rss_before is not None and rss_after is not None else None,
+                "rss_mb": round(rss_after, 1) if rss_after is not None else None,
+            }
+            self.records.append(record)
+            logger.info(json.dumps({"evento": "etapa", **record}, ensure_ascii=False))
+            _accumulate(name, elapsed_ms)
+
+    def total_ms(self) -> float:
+        return sum(record["tempo_ms"] for record in self.records)
+
+def start_run(enabled: bool = ENABLED_BY_ENV) -> StageRecorder:
+    """Cria o registrador da execução atual e o torna visível para stage()."""
+    recorder = StageRecorder(enabled)
+    _current_recorder.set(recorder)
+    if enabled and not logger.handlers:
+        # Linhas JSON em stderr, independentemente da configuração de logging do Streamlit.
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return recorder
+
+@contextmanager
+def stage(name: str, **info):
+    """Mede uma etapa no registrador da execução atual (sem custo se desativado)."""
+    recorder = _current_recorder.get()
+    if recorder is None or not recorder.enabled:
+        yield info
+        return
+    with recorder.stage(name, **info) as stage_info:
+        yield stage_info
+
+def _accumulate(name: str, elapsed_ms: float) -> None:
+    with _totals_lock:
+        count, total = _totals.get(name, (0, 0.0))
+        _totals[name] = (count + 1, total + elapsed_ms)
+        snapshot = dict(_totals)
+    if METRICS_FILE:
+        _write_prometheus(snapshot)
+
+def _write_prometheus(snapshot: dict) -> None:
+    lines = [
+        "# HELP comex_etapa_execucoes_total Número de execuções da etapa.",
+        "# TYPE comex_etapa_execucoes_total counter",
+    ]
+    lines += [f'comex_etapa_execucoes_total{{etapa="{name}"}} {count}' for name, (count, _) in sorted(snapshot.items())]
+    lines += [
+        "# HELP comex_etapa_segundos_total Tempo acumulado da etapa em segundos.",
+        "# TYPE comex_etapa_segundos_total counter",
+    ]
+    lines += [f'comex_etapa_segundos_total{{etapa="{name}"}} {total / 1000:.6f}' for name, (_, total) in sorted(snapshot.items())]
+    try:
+        tmp_path = f"{METRICS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, METRICS_FILE)
+    except OSError:
+        logger.warning("Não foi possível gravar as métricas em %s", METRICS_FILE)
@@ -0,0 +1,143 @@
+# coding: utf-8
+# Triagem de surtos de importação: médias móveis, variações mensal e anual,
+# participação da China e preço médio (US$/kg) calculados para todos os NCMs de
+# uma vez sobre o cubo agregado, e ranqueados por critérios configuráveis.
+#
+# Cada coluna do cubo vira uma matriz chaves × meses do calendário completo (do
+# primeiro ao último período do cubo, com NaN nos meses ausentes do extrato);
+# as médias móveis saem de somas acumuladas ao longo dos meses, sem laço por NCM.
+import numpy as np
+import pandas as pd
+
+from comex_data import COL_NCM_CODIGO, NIVEIS_NCM, MESES_NUM_TO_NOME_ABBR
+from comex_charts import SMA_WINDOW, format_numbers_br
+
+# Defasagem (em meses) da variação anual.
+YOY_LAG = 12
+
+# Critérios de ranqueamento: rótulo -> (coluna das métricas, ordem crescente?).
+SURGE_CRITERIA = {
+    "Variação anual da importação da China (%)": ("china_yoy_pct", False),
+    "Variação mensal da importação da China (%)": ("china_mom_pct", False),
+    "Ganho de participação da China em 12 meses (p.p.)": ("china_share_delta_pp", False),
+    "Importação da China - média móvel (KG)": ("china_sma_kg", False),
+    "Menor preço médio da China (US$/kg)": ("china_price_usd_kg", True),
+}
+
+METRIC_COLUMNS = [
+    "china_kg", "china_sma_kg", "total_sma_kg",
+    "china_mom_pct", "china_yoy_pct", "total_yoy_pct",
+    "china_share_pct", "china_share_delta_pp",
+    "china_price_usd_kg", "total_price_usd_kg",
+]
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # Divisão elemento a elemento com NaN onde o denominador é zero.
+    result = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Somas móveis ao longo dos meses (eixo 1) de uma matriz chaves × meses."""
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumulative[:, 1:])
+    start = np.maximum(np.arange(1, values.shape[1] + 1) - window, 0)
+    return cumulative[:, 1:] - cumulative[:, start]
+
+def _monthly_calendar(periods) -> pd.MultiIndex:
+    # Todos os meses do primeiro ao último período, inclusive os que faltam no
+    # cubo (ex.: extrato só com janeiro a abril de cada ano).
+    months = [int(ano) * 12 + int(mes) - 1 for ano, mes in periods]
+    calendar = np.arange(min(months), max(months) + 1)
+    return pd.MultiIndex.from_arrays([calendar // 12, calendar % 12 + 1], names=["Ano", "month_num"])
+
+def _level_cube(cube: pd.DataFrame, nivel: str) -> pd.DataFrame:
+    codes = cube.index.get_level_values(COL_NCM_CODIGO).astype(str)
+    return cube[codes.str.len() == NIVEIS_NCM[nivel]]
+
+def available_periods(cube: pd.DataFrame) -> list:
+    """Períodos (ano, mês) com alguma importação registrada, em ordem cronológica."""
+    if cube.empty:
+        return []
+    totals = cube["Importacao_kg_Total"].groupby(level=["Ano", "month_num"], observed=True).sum()
+    return [(int(ano), int(mes)) for ano, mes in totals[totals > 0].index]
+
+def period_label(period) -> str:
+    ano, mes = period
+    return f"{MESES_NUM_TO_NOME_ABBR[mes]}/{ano}"
+
+def compute_surge_metrics(cube: pd.DataFrame, reference=None, nivel: str = "NCM", window: int = SMA_WINDOW) -> pd.DataFrame:
+    """Métricas de importação de todas as chaves de um nível no mês de referência.
+
+    reference é um período (ano, mês); por padrão, o último com importação
+    registrada. Médias móveis usam a mesma janela dos gráficos (SMA_WINDOW
+    meses do calendário, com a média dos meses presentes no cubo); as variações
+    mensal e anual comparam essas médias com as do mês anterior e do mesmo mês
+    do ano anterior no calendário, não com a coluna vizinha. Participação da
+    China e preços médios (US$ FOB / kg) usam as somas da janela. Variações sem
+    base (zero, mês ausente do cubo ou fora do período disponível) ficam NaN.
+    """
+    level_cube = _level_cube(cube, nivel)
+    periods = available_periods(level_cube)
+    if not periods:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+    reference = tuple(reference) if reference else periods[-1]
+    columns = ["Importacao_kg_Total", "Importacao_kg_China", "Importacao_usd_Total", "Importacao_usd_China"]
+    wide = level_cube[columns].unstack(["Ano", "month_num"], fill_value=0)
+    stored_periods = wide[columns[0]].columns
+    calendar = _monthly_calendar(stored_periods)
+    present = calendar.isin(stored_periods)
+    t = list(calendar).index(reference)
+    # Meses ausentes do cubo ficam fora das somas e das contagens das janelas.
+    matrices = {col: wide[col].reindex(columns=calendar).to_numpy(dtype="float64") for col in columns}
+    counts = _window_sums(present[np.newaxis, :].astype("float64"), window)[0]
+    sums = {}
+    for col, values in matrices.items():
+        sums[col] = _window_sums(np.nan_to_num(values), window)
+        sums[col][:, ~present] = np.nan
+    china_sma = _ratio(sums["Importacao_kg_China"], counts)
+    total_sma = _ratio(sums["Importacao_kg_Total"], counts)
+    china_share = _ratio(sums["Importacao_kg_China"], sums["Importacao_kg_Total"]) * 100
+    nan_column = np.full(len(wide), np.nan)
+
+    def lagged(values: np.ndarray, lag: int) -> np.ndarray:
+        return values[:, t - lag] if t - lag >= 0 else nan_column
+
+    metrics = pd.DataFrame({
+        "china_kg": matrices["Importacao_kg_China"][:, t],
+        "china_sma_kg": china_sma[:, t],
+        "total_sma_kg": total_sma[:, t],
+        "china_mom_pct": (_ratio(china_sma[:, t], lagged(china_sma, 1)) - 1) * 100,
+        "china_yoy_pct": (_ratio(china_sma[:, t], lagged(china_sma, YOY_LAG)) - 1) * 100,
+        "total_yoy_pct": (_ratio(total_sma[:, t], lagged(total_sma, YOY_LAG)) - 1) * 100,
+        "china_share_pct": china_share[:, t],
+        "china_share_delta_pp": china_share[:, t] - lagged(china_share, YOY_LAG),
+        "china_price_usd_kg": _ratio(sums["Importacao_usd_China"][:, t], sums["Importacao_kg_China"][:, t]),
+        "total_price_usd_kg": _ratio(sums["Importacao_usd_Total"][:, t], sums["Importacao_kg_Total"][:, t]),
+    }, index=pd.Index(wide.index.astype(str), name=COL_NCM_CODIGO))
+    return metrics[METRIC_COLUMNS]
+
+def rank_surges(metrics: pd.DataFrame, criterio: str, min_china_kg: float = 0, n: int = 50) -> pd.DataFrame:
+    """Chaves ordenadas pelo critério, só com média móvel da China >= min_china_kg."""
+    column, ascending = SURGE_CRITERIA[criterio]
+    candidates = metrics[(metrics["china_sma_kg"] >= min_china_kg) & metrics[column].notna()]
+    return candidates.sort_values(by=column, ascending=ascending, kind="stable").head(n)
+
+def surge_table(ranked: pd.DataFrame, descriptions: dict) -> pd.DataFrame:
+    """Ranking formatado em pt-BR para exibição (variações sem base aparecem como "-")."""
+    def fmt(column: str, decimal_places: int):
+        values = ranked[column]
+        return np.where(values.notna(), format_numbers_br(values.fillna(0), decimal_places), "-")
+    return pd.DataFrame({
+        "Código": ranked.index,
+        "Descrição": [descriptions.get(key, "") for key in ranked.index],
+        "China - mês (KG)": fmt("china_kg", 0),
+        f"China - média {SMA_WINDOW}m (KG)": fmt("china_sma_kg", 0),
+        "Var. mensal China (%)": fmt("china_mom_pct", 1),
+        "Var. anual China (%)": fmt("china_yoy_pct", 1),
+        "Var. anual total (%)": fmt("total_yoy_pct", 1),
+        "Participação China (%)": fmt("china_share_pct", 1),
+        "Var. participação 12m (p.p.)": fmt("china_share_delta_pp", 1),
+        "Preço China (US$/kg)": fmt("china_price_usd_kg", 2),
+        "Preço total (US$/kg)": fmt("total_price_usd_kg", 2),
+    })
@@ -0,0 +1,189 @@
+# coding: utf-8
+# Armazenamento local particionado por ano/mês para ingestão incremental de
+# extratos do Comex Stat.
+#
+# Uso:
+#     python comex_store.py H_EXPORTACAO_E_IMPORTACAO_GERAL_2025-04.xlsx
+#
+# Cada partição guarda as linhas da tabela longa daquele (ano, mês) e os
+# agregados parciais correspondentes: o cubo, a importação por NCM × país × ano
+# (tabela de origem) e os NCMs com suas descrições (índice de busca). Um novo extrato (ou uma correção) regrava
+# somente as partições que contém; o restante do histórico não é relido.
+# Dentro de cada partição, só os pares (NCM, país) presentes no extrato são
+# substituídos: extratos filtrados (um capítulo, os NCMs de um grupo, alguns
+# países) não apagam os demais NCMs já armazenados para o mesmo mês.
+import argparse
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from comex_data import (
+    SHEET_NAME, COL_NCM_CODIGO, COL_NCM_DESCRICAO, COL_PAIS, CUBE_INDEX, CUBE_COLUMNS, KEY_COLUMNS, ORIGIN_COLUMNS,
+    read_long_data, build_aggregate_cube, complete_cube_periods, build_origin_table,
+)
+
+STORE_DIR = os.environ.get("COMEX_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "store"))
+MANIFEST_FILE = "manifest.json"
+# Chaves substituídas por um novo extrato dentro de cada partição.
+MERGE_KEYS = [COL_NCM_CODIGO, COL_PAIS]
+
+def _partition_key(ano: int, mes: int) -> str:
+    return f"{ano:04d}-{mes:02d}"
+
+def _partition_path(store_dir: str, kind: str, ano: int, mes: int) -> str:
+    return os.path.join(store_dir, kind, f"ano={ano:04d}", f"mes={mes:02d}.parquet")
+
+def read_manifest(store_dir: str = STORE_DIR) -> dict:
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"version": 0, "partitions": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_atomic_parquet(df: pd.DataFrame, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def _write_manifest(manifest: dict, store_dir: str) -> None:
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def store_version(store_dir: str = STORE_DIR) -> int:
+    """Versão do armazenamento (0 se vazio); muda a cada ingestão."""
+    manifest = read_manifest(store_dir)
+    return manifest["version"] if manifest["partitions"] else 0
+
+def _origin_partial(df_partition: pd.DataFrame) -> pd.DataFrame:
+    # Importação (kg) por NCM × país × ano do mês; participação e rank só no total.
+    return build_origin_table(df_partition)[[COL_NCM_CODIGO, COL_PAIS, "Ano", "Importacao_kg"]]
+
+def _ncms_partial(df_partition: pd.DataFrame) -> pd.DataFrame:
+    # NCMs e descrições presentes no mês (base do índice de busca).
+    return df_partition[[COL_NCM_CODIGO, COL_NCM_DESCRICAO]].drop_duplicates(subset=[COL_NCM_CODIGO]).astype(str)
+
+# Agregados parciais gravados junto com os dados de cada partição.
+PARTIALS = {
+    "cubo": lambda df_partition: build_aggregate_cube(df_partition, complete=False).reset_index(),
+    "origem": _origin_partial,
+    "ncms": _ncms_partial,
+}
+
+def _merge_partition(df_stored: pd.DataFrame, df_new: pd.DataFrame, merge_keys: list, extract_keys: pd.MultiIndex) -> pd.DataFrame:
+    # Mantém as linhas armazenadas cujos pares (NCM, país) não aparecem no extrato.
+    stored_keys = pd.MultiIndex.from_frame(df_stored[merge_keys].astype(str))
+    df_kept = df_stored[~stored_keys.isin(extract_keys)]
+    if df_kept.empty:
+        return df_new
+    merged = pd.concat([df_kept, df_new], ignore_index=True)
+    return _restore_categories(merged, KEY_COLUMNS).sort_values(["Ano", "month_num"] + merge_keys, kind="stable").reset_index(drop=True)
+
+def ingest_extract(source, sheet_name: str = SHEET_NAME, store_dir: str = STORE_DIR) -> list:
+    """Grava no armazenamento as partições (ano, mês) contidas no extrato.
+
+    Apenas as partições com algum valor no extrato são regravadas, junto com o
+    cubo parcial de cada uma; meses ainda não publicados (todos zerados) não
+    sobrescrevem dados existentes. Em cada partição regravada, as linhas dos
+    pares (NCM, país) presentes no extrato são substituídas pelas do extrato
+    (um par sem valor naquele mês deixa de existir nele) e as dos demais pares
+    são mantidas. Retorna a lista de partições gravadas.
+    """
+    df_long = read_long_data(source, sheet_name)
+    manifest = read_manifest(store_dir)
+    merge_keys = [col for col in MERGE_KEYS if col in df_long.columns]
+    extract_keys = pd.MultiIndex.from_frame(df_long[merge_keys].astype(str)).unique()
+    written = []
+    for (ano, mes), df_partition in df_long.groupby(["Ano", "month_num"], observed=True, sort=True):
+        ano, mes = int(ano), int(mes)
+        df_partition = df_partition.reset_index(drop=True)
+        if _partition_key(ano, mes) in manifest["partitions"]:
+            df_stored = pd.read_parquet(_partition_path(store_dir, "dados", ano, mes))
+            df_partition = _merge_partition(df_stored, df_partition, merge_keys, extract_keys)
+        _write_atomic_parquet(df_partition, _partition_path(store_dir, "dados", ano, mes))
+        for kind, build_partial in PARTIALS.items():
+            _write_atomic_parquet(build_partial(df_partition), _partition_path(store_dir, kind, ano, mes))
+        manifest["partitions"][_partition_key(ano, mes)] = {
+            "linhas": len(df_partition),
+            "fonte": os.path.basename(str(source)),
+            "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+        }
+        written.append((ano, mes))
+    if written:
+        manifest["version"] = manifest.get("version", 0) + 1
+        _write_manifest(manifest, store_dir)
+    return written
+
+def _read_partitions(store_dir: str, kind: str) -> list:
+    frames = []
+    for key in sorted(read_manifest(store_dir)["partitions"]):
+        ano, mes = (int(part) for part in key.split("-"))
+        path = _partition_path(store_dir, kind, ano, mes)
+        if kind in PARTIALS and not os.path.exists(path):
+            # Partição gravada antes deste agregado existir: calcula a partir dos dados.
+            frames.append(PARTIALS[kind](pd.read_parquet(_partition_path(store_dir, "dados", ano, mes))))
+        else:
+            frames.append(pd.read_parquet(path))
+    return frames
+
+def _restore_categories(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    # Partições com categorias distintas viram object no concat; volta a categoria.
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def load_store_data(store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """Tabela longa completa a partir das partições do armazenamento."""
+    frames = _read_partitions(store_dir, "dados")
+    if not frames:
+        return pd.DataFrame()
+    return _restore_categories(pd.concat(frames, ignore_index=True), KEY_COLUMNS)
+
+def load_store_cube(store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """Cubo NCM × ano × mês montado a partir dos cubos parciais, sem reagregar os dados."""
+    frames = _read_partitions(store_dir, "cubo")
+    if not frames:
+        return build_aggregate_cube(pd.DataFrame())
+    cube = _restore_categories(pd.concat(frames, ignore_index=True), [COL_NCM_CODIGO])
+    # Partições gravadas antes de uma coluna nova do cubo ficam com zero até serem reingeridas.
+    cube = cube.set_index(CUBE_INDEX).reindex(columns=CUBE_COLUMNS).fillna(0)
+    return complete_cube_periods(cube)
+
+def load_store_origin_table(store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """Tabela de origem (NCM × país × ano) somando as parciais mensais, sem reler os dados."""
+    frames = _read_partitions(store_dir, "origem")
+    if not frames:
+        return pd.DataFrame(columns=ORIGIN_COLUMNS)
+    # build_origin_table soma as parciais por NCM × ano × país e calcula participação e rank.
+    return build_origin_table(_restore_categories(pd.concat(frames, ignore_index=True), [COL_NCM_CODIGO, COL_PAIS]))
+
+def load_store_ncms(store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """NCMs e descrições de todas as partições, para o índice de busca."""
+    frames = _read_partitions(store_dir, "ncms")
+    if not frames:
+        return pd.DataFrame(columns=[COL_NCM_CODIGO, COL_NCM_DESCRICAO])
+    return pd.concat(frames, ignore_index=True).drop_duplicates(subset=[COL_NCM_CODIGO], keep="last").reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingestão incremental de extratos do Comex Stat no armazenamento particionado por ano/mês.",
+        epilog="Em cada mês presente no extrato, os pares (NCM, país) do extrato substituem os armazenados; "
+               "os demais NCMs e países daquele mês são mantidos. Meses sem nenhum valor no extrato não são alterados.",
+    )
+    parser.add_argument("arquivos", nargs="+", help="Planilhas XLSX exportadas do Comex Stat")
+    parser.add_argument("--aba", default=SHEET_NAME, help=f"Aba com os resultados (padrão: {SHEET_NAME})")
+    parser.add_argument("--store", default=STORE_DIR, help=f"Diretório do armazenamento (padrão: {STORE_DIR})")
+    args = parser.parse_args()
+    for arquivo in args.arquivos:
+        written = ingest_extract(arquivo, args.aba, args.store)
+        partitions = ", ".join(_partition_key(ano, mes) for ano, mes in written) or "nenhuma"
+        print(f"{arquivo}: {len(written)} partição(ões) gravada(s): {partitions}")
+
+if __name__ == "__main__":
+    main()
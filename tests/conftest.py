@@ -0,0 +1,27 @@
+# coding: utf-8
+# Os módulos do projeto ficam na raiz do repositório (sem pacote instalável).
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comex_data import COL_NCM_CODIGO, COL_NCM_DESCRICAO, COL_PAIS, KEY_COLUMNS, VALUE_COLUMNS  # noqa: E402
+
+@pytest.fixture
+def make_long():
+    """Tabela longa a partir de tuplas (NCM, país, ano, mês, importação kg[, importação US$])."""
+    def build(rows):
+        records = []
+        for ncm, pais, ano, mes, kg, *usd in rows:
+            records.append({
+                COL_NCM_CODIGO: ncm, COL_NCM_DESCRICAO: f"Produto {ncm}", COL_PAIS: pais,
+                "Ano": ano, "month_num": mes,
+                "Exportacao_kg": 0, "Exportacao_usd": 0,
+                "Importacao_kg": kg, "Importacao_usd": usd[0] if usd else kg * 2,
+            })
+        df = pd.DataFrame.from_records(records, columns=KEY_COLUMNS + ["Ano", "month_num"] + VALUE_COLUMNS)
+        return df.astype({col: "category" for col in KEY_COLUMNS})
+    return build
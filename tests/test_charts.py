@@ -0,0 +1,31 @@
+# coding: utf-8
+import numpy as np
+import pytest
+
+from comex_charts import format_numbers_br
+
+def _format_scalar_br(value, decimal_places=2):
+    # Formatação escalar anterior (f-string do Python), usada como referência.
+    return f"{float(value):,.{decimal_places}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+@pytest.mark.parametrize("decimal_places", [0, 1, 2])
+def test_matches_scalar_formatting(decimal_places):
+    rng = np.random.default_rng(0)
+    # Valores com até 3 casas longe de empates no arredondamento, de ambos os sinais e magnitudes.
+    values = np.concatenate([
+        [0, 1, -1, 999, 1000, -1000, 1234567, 10 ** 12],
+        np.round(rng.lognormal(8, 4, 500) * rng.choice([-1, 1], 500), 3),
+    ])
+    values = values[np.abs(values * 10 ** decimal_places % 1 - 0.5) > 1e-3]
+    expected = [_format_scalar_br(value, decimal_places) for value in values]
+    assert list(format_numbers_br(values, decimal_places)) == expected
+
+def test_keeps_shape_and_non_finite():
+    values = np.array([[1234.5, np.nan], [np.inf, -np.inf]])
+    assert format_numbers_br(values, 1).tolist() == [["1.234,5", "nan"], ["inf", "-inf"]]
+
+@pytest.mark.parametrize("value, vectorized, scalar", [(0.005, "0,00", "0,01"), (2.675, "2,68", "2,67")])
+def test_documented_rounding_differences(value, vectorized, scalar):
+    # np.round sobre o valor escalado (metade para o par) vs. arredondamento decimal do Python.
+    assert format_numbers_br([value], 2)[0] == vectorized
+    assert _format_scalar_br(value, 2) == scalar
@@ -0,0 +1,48 @@
+# coding: utf-8
+import numpy as np
+import pandas as pd
+import pytest
+
+from comex_data import (
+    COL_NCM_CODIGO, CUBE_COLUMNS, PAIS_CHINA,
+    build_aggregate_cube, build_group_cube, parse_groups_config,
+)
+
+@pytest.fixture
+def cube(make_long):
+    rng = np.random.default_rng(0)
+    ncms = ["72083700", "72083890", "73051100", "73051200", "73061900"]
+    rows = [
+        (ncm, pais, ano, mes, int(rng.integers(0, 1000)))
+        for ncm in ncms for pais in (PAIS_CHINA, "EGITO") for ano in (2024, 2025) for mes in range(1, 13)
+        if rng.random() > 0.3
+    ]
+    return build_aggregate_cube(make_long(rows))
+
+GROUPS = {
+    "ABITAM": ["73051100", "73051200", "73061900"],
+    "SOBREPOSTO": ["72083700", "73051100"],
+    "SEM_DADOS": ["99999999"],
+}
+
+@pytest.mark.parametrize("group_name", list(GROUPS))
+def test_group_cube_matches_isin_groupby(cube, group_name):
+    group_cube = build_group_cube(cube, GROUPS)
+    codes = cube.index.get_level_values(COL_NCM_CODIGO).astype(str)
+    expected = (
+        cube[codes.isin(GROUPS[group_name])].groupby(level=["Ano", "month_num"])[CUBE_COLUMNS].sum()
+        .reindex(cube.index.droplevel(COL_NCM_CODIGO).unique().sort_values(), fill_value=0)
+    )
+    actual = group_cube.xs(group_name, level=COL_NCM_CODIGO)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_names=False)
+
+@pytest.mark.parametrize("config, message", [
+    ({"X": ["73051100"]}, "Grupo 'X'"),
+    ({"X": {"ncms": "73051100"}}, "Grupo 'X'"),
+    ({"X": {"ncms": ["7305110"]}}, "7305110"),
+    ({"7208": {"ncms": ["73051100"]}}, "Grupo '7208'"),
+    (["73051100"], "objeto"),
+])
+def test_invalid_group_config_raises_value_error(config, message):
+    with pytest.raises(ValueError, match=message):
+        parse_groups_config(config)
@@ -0,0 +1,82 @@
+# coding: utf-8
+import http.server
+import threading
+import urllib.error
+
+import pytest
+
+from comex_fetch import fetch_source
+
+class _Source(http.server.BaseHTTPRequestHandler):
+    # Servidor de teste: responde 304 quando o ETag enviado é o atual.
+    content = b"versao 1"
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    _Source.content, _Source.etag, _Source.requests = b"versao 1", '"v1"', []
+    httpd = http.server.HTTPServer(("127.0.0.1", 0), _Source)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_port}/extrato.xlsx"
+    httpd.shutdown()
+    httpd.server_close()
+
+def _read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_revalidation_304_reuses_local_copy(server, tmp_path):
+    _, url = server
+    path, fingerprint = fetch_source(url, str(tmp_path))
+    assert _read(path) == b"versao 1"
+    assert fetch_source(url, str(tmp_path)) == (path, fingerprint)
+    assert _Source.requests == [None, '"v1"']
+
+def test_new_version_is_downloaded(server, tmp_path):
+    _, url = server
+    _, old_fingerprint = fetch_source(url, str(tmp_path))
+    _Source.content, _Source.etag = b"versao 2", '"v2"'
+    path, fingerprint = fetch_source(url, str(tmp_path))
+    assert fingerprint != old_fingerprint
+    assert _read(path) == b"versao 2"
+
+def test_max_age_skips_network(server, tmp_path):
+    _, url = server
+    first = fetch_source(url, str(tmp_path))
+    assert fetch_source(url, str(tmp_path), max_age=3600) == first
+    assert len(_Source.requests) == 1
+
+def test_offline_falls_back_to_local_copy(server, tmp_path):
+    httpd, url = server
+    first = fetch_source(url, str(tmp_path))
+    httpd.shutdown()
+    httpd.server_close()
+    assert fetch_source(url, str(tmp_path), timeout=2) == first
+
+def test_first_fetch_error_propagates(server, tmp_path):
+    httpd, url = server
+    httpd.shutdown()
+    httpd.server_close()
+    with pytest.raises(urllib.error.URLError):
+        fetch_source(url, str(tmp_path), timeout=2)
+
+def test_missing_local_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        fetch_source(str(tmp_path / "nao_existe.xlsx"), str(tmp_path))
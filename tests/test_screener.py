@@ -0,0 +1,38 @@
+# coding: utf-8
+import numpy as np
+import pytest
+
+from comex_charts import SMA_WINDOW
+from comex_data import PAIS_CHINA, build_aggregate_cube
+from comex_screener import compute_surge_metrics
+
+# Extrato só com janeiro a abril de 2024 e 2025 (consulta "mesmo período" do Comex Stat).
+CHINA_KG = {(2024, 1): 100, (2024, 2): 100, (2024, 3): 200, (2024, 4): 200,
+            (2025, 1): 400, (2025, 2): 400, (2025, 3): 400, (2025, 4): 400}
+
+@pytest.fixture
+def months_subset_cube(make_long):
+    return build_aggregate_cube(make_long([("73051100", PAIS_CHINA, ano, mes, kg) for (ano, mes), kg in CHINA_KG.items()]))
+
+@pytest.mark.parametrize("periodo, sma, mom, yoy", [
+    # Janeiro/2025: média só com janeiro (nov. e dez./2024 ausentes), sem mês anterior, base em janeiro/2024.
+    ((2025, 1), 400, np.nan, 300),
+    ((2025, 2), 400, 0, 300),
+    ((2025, 4), 400, 0, (400 / ((100 + 200 + 200) / SMA_WINDOW) - 1) * 100),
+])
+def test_lags_follow_calendar_on_months_subset(months_subset_cube, periodo, sma, mom, yoy):
+    metrics = compute_surge_metrics(months_subset_cube, periodo).loc["73051100"]
+    atual = (metrics["china_sma_kg"], metrics["china_mom_pct"], metrics["china_yoy_pct"])
+    np.testing.assert_allclose(atual, (sma, mom, yoy), equal_nan=True)
+
+def test_full_year_matches_plain_rolling(make_long):
+    rows = [("73051100", PAIS_CHINA, ano, mes, 10 * (12 * (ano - 2024) + mes)) for ano in (2024, 2025) for mes in range(1, 13)]
+    metrics = compute_surge_metrics(build_aggregate_cube(make_long(rows)), (2025, 6)).loc["73051100"]
+    kg = {(ano, mes): kg for _, _, ano, mes, kg in rows}
+    sma = np.mean([kg[(2025, m)] for m in (4, 5, 6)])
+    sma_mes_anterior = np.mean([kg[(2025, m)] for m in (3, 4, 5)])
+    sma_ano_anterior = np.mean([kg[(2024, m)] for m in (4, 5, 6)])
+    assert metrics["china_sma_kg"] == pytest.approx(sma)
+    assert metrics["china_mom_pct"] == pytest.approx((sma / sma_mes_anterior - 1) * 100)
+    assert metrics["china_yoy_pct"] == pytest.approx((sma / sma_ano_anterior - 1) * 100)
+    assert metrics["china_price_usd_kg"] == pytest.approx(2)
@@ -0,0 +1,50 @@
+# coding: utf-8
+import pytest
+
+import comex_store
+from comex_data import COL_NCM_CODIGO, COL_PAIS, PAIS_CHINA
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    # Ingestão de um extrato já no formato longo (sem planilha).
+    def run(df_long):
+        monkeypatch.setattr(comex_store, "read_long_data", lambda source, sheet_name: df_long)
+        return comex_store.ingest_extract("extrato.xlsx", store_dir=str(tmp_path))
+    return run
+
+def _stored(store_dir) -> dict:
+    df = comex_store.load_store_data(store_dir)
+    return {
+        (ncm, pais, int(ano), int(mes)): kg
+        for ncm, pais, ano, mes, kg in zip(df[COL_NCM_CODIGO].astype(str), df[COL_PAIS].astype(str), df["Ano"], df["month_num"], df["Importacao_kg"])
+    }
+
+def test_filtered_extract_keeps_other_ncms(ingest, make_long, tmp_path):
+    ingest(make_long([
+        ("73051100", PAIS_CHINA, 2025, 1, 10), ("73051100", "EGITO", 2025, 1, 20), ("72083700", PAIS_CHINA, 2025, 1, 30),
+    ]))
+    written = ingest(make_long([("73051100", PAIS_CHINA, 2025, 1, 15)]))
+    assert written == [(2025, 1)]
+    assert _stored(str(tmp_path)) == {
+        ("73051100", PAIS_CHINA, 2025, 1): 15,
+        ("73051100", "EGITO", 2025, 1): 20,
+        ("72083700", PAIS_CHINA, 2025, 1): 30,
+    }
+
+def test_pair_without_value_in_written_month_is_removed(ingest, make_long, tmp_path):
+    ingest(make_long([("73051100", PAIS_CHINA, 2025, 1, 10), ("73051100", PAIS_CHINA, 2025, 2, 10)]))
+    # Correção: o par só tem valor em fevereiro; janeiro é regravado por causa de outro NCM.
+    ingest(make_long([("73051100", PAIS_CHINA, 2025, 2, 5), ("72083700", PAIS_CHINA, 2025, 1, 1)]))
+    assert _stored(str(tmp_path)) == {
+        ("73051100", PAIS_CHINA, 2025, 2): 5,
+        ("72083700", PAIS_CHINA, 2025, 1): 1,
+    }
+
+def test_partial_cube_and_origin_follow_merge(ingest, make_long, tmp_path):
+    ingest(make_long([("73051100", PAIS_CHINA, 2025, 1, 10), ("72083700", "EGITO", 2025, 1, 30)]))
+    ingest(make_long([("73051100", PAIS_CHINA, 2025, 1, 15)]))
+    cube = comex_store.load_store_cube(str(tmp_path))
+    assert cube.loc[("73051100", 2025, 1), "Importacao_kg_China"] == 15
+    assert cube.loc[("72083700", 2025, 1), "Importacao_kg_Total"] == 30
+    origin = comex_store.load_store_origin_table(str(tmp_path))
+    assert sorted(zip(origin[COL_NCM_CODIGO].astype(str), origin["Importacao_kg"])) == [("72083700", 30), ("73051100", 15)]